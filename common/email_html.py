@@ -0,0 +1,49 @@
+"""
+Markdown summary rendering shared by the digest senders and the webhook server.
+"""
+
+import re
+from functools import lru_cache
+
+import mistune
+
+# Inline styles for the tags mistune emits inside a summary. Applied with one
+# regex pass so rendering doesn't need a CSS parser or an lxml tree per summary.
+MARKDOWN_STYLES = {
+    "ul": "margin:8px 0; padding-left:20px",
+    "ol": "margin:8px 0; padding-left:20px",
+    "li": "margin:4px 0; color:#333",
+    "p": "margin:8px 0",
+    "strong": "font-weight:600",
+    "b": "font-weight:600",
+    "code": (
+        "background:#f4f4f4; padding:2px 6px; border-radius:3px; "
+        "font-size:13px; font-family:monospace"
+    ),
+    "a": "color:#1a73e8",
+}
+STYLED_TAG_RE = re.compile(r"<(%s)(?=[\s>])" % "|".join(MARKDOWN_STYLES))
+# One line of prose with no markdown syntax, HTML-special characters or
+# leading list/heading markers renders as a single bare paragraph
+PLAIN_TEXT_RE = re.compile(r"[A-Za-z][A-Za-z0-9 ,.;:'()?!%$/-]*")
+
+
+def _style_tag(match: re.Match) -> str:
+    tag = match.group(1)
+    return f'<{tag} style="{MARKDOWN_STYLES[tag]}"'
+
+
+# Same summary text always renders the same, so keep recent results around
+@lru_cache(maxsize=1024)
+def md_to_email_html(text: str) -> str:
+    """Convert markdown to email-safe HTML with inline styles."""
+    if not text:
+        return "<p>No summary available.</p>"
+
+    if PLAIN_TEXT_RE.fullmatch(text):
+        # Nothing for mistune to do; this is exactly what it would emit
+        html = f"<p>{text.strip()}</p>\n"
+    else:
+        # mistune.html is a prebuilt parser instance, reused across calls
+        html = mistune.html(text)
+    return f'<div class="summary">{STYLED_TAG_RE.sub(_style_tag, html)}</div>'
@@ -0,0 +1,28 @@
+"""
+Thread-safe request pacing shared by the API clients.
+"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    """Spaces calls out to at most ``rate`` per second, across threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.last_call = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            delay = self.last_call + self.interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.last_call = time.monotonic()
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller back for ``seconds``, e.g. after a 429."""
+        with self._lock:
+            resume = time.monotonic() + seconds - self.interval
+            self.last_call = max(self.last_call, resume)
@@ -0,0 +1,77 @@
+"""
+Resend setup shared by every email sender.
+
+Importing this module configures the resend SDK once per process: the API key
+from the environment and a keep-alive transport for all calls. call_resend
+paces every call in the process through one limiter, since Resend's rate
+limit is per team rather than per sender.
+"""
+
+import os
+import logging
+import random
+
+from dotenv import load_dotenv
+import httpx
+import resend
+
+from common.rate_limit import RateLimiter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RESEND_MAX_ATTEMPTS = 4  # tries per Resend call when rate limited
+
+
+class KeepAliveResendClient(resend.HTTPClient):
+    """Resend transport that reuses one httpx connection pool across calls.
+
+    The SDK's default client goes through ``requests.request``, which opens a
+    fresh connection (and TLS handshake) for every API call.
+    """
+
+    def __init__(self, timeout: float = 30.0):
+        self._client = httpx.Client(timeout=timeout)
+
+    def request(self, method, url, headers, json=None):
+        try:
+            resp = self._client.request(method, url, headers=headers, json=json)
+        except httpx.HTTPError as e:
+            # resend.Request.perform turns this into a ResendError
+            raise RuntimeError(f"Request failed: {e}") from e
+        return resp.content, resp.status_code, resp.headers
+
+
+# Configured once at import; every send goes through the same connection pool
+resend.api_key = os.environ.get("RESEND_API_KEY", "")
+resend.default_http_client = KeepAliveResendClient()
+if not resend.api_key:
+    logger.error("RESEND_API_KEY not set; emails will not be sent")
+
+
+# Resend allows 2 requests/second per team; stay just under it
+RESEND_LIMITER = RateLimiter(rate=1.8)
+
+
+def call_resend(send, payload, *args):
+    """Rate-limit a Resend API call and retry it with backoff on 429s.
+
+    Only the per-second rate limit is retried. Daily and monthly quota errors
+    also come back as RateLimitError but won't clear by waiting, so they are
+    raised straight away.
+    """
+    for attempt in range(1, RESEND_MAX_ATTEMPTS + 1):
+        RESEND_LIMITER.wait()
+        try:
+            return send(payload, *args)
+        except resend.exceptions.RateLimitError as e:
+            if e.error_type != "rate_limit_exceeded" or attempt == RESEND_MAX_ATTEMPTS:
+                raise
+            delay = 2**attempt + random.uniform(0, 1)
+            logger.warning(
+                f"Resend rate limited, retrying in {delay:.1f}s "
+                f"(attempt {attempt}/{RESEND_MAX_ATTEMPTS})"
+            )
+            # Back off every sender sharing the limiter, not just this thread
+            RESEND_LIMITER.pause(delay)
@@ -3,14 +3,19 @@ GovInfo Daily Crawler
 Fetches document URLs and metadata from govinfo.gov
 """
 
+import atexit
 import json
+import random
 import sqlite3
+import time
 import httpx
 from datetime import datetime, timedelta
 from pathlib import Path
 from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
 from typing import Iterator
-import time
 import logging
 
 logging.basicConfig(
@@ -22,13 +27,21 @@ logger = logging.getLogger(__name__)
 BASE_URL = "https://www.govinfo.gov"
 SEARCH_URL = "https://www.govinfo.gov/wssearch/search"
 PAGE_SIZE = 100
+MAX_CONCURRENCY = 8  # max in-flight search page requests
+CHUNK_SIZE = 1000  # documents per SQLite write while streaming a crawl
+MAX_ATTEMPTS = 5  # tries per search page before giving up
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF = 30.0  # seconds
+
+# Shared HTTP client, created on first use and closed at exit
+_http_client: httpx.Client | None = None
 
 # Default database path
 DATA_DIR = Path(__file__).parent.parent / "data"
 DEFAULT_DB_PATH = DATA_DIR / "govinfo.db"
 
 
-@dataclass
+@dataclass(slots=True)
 class Document:
     package_id: str
     title: str
@@ -42,6 +55,22 @@ class Document:
     summary: str | None = None
 
 
+def get_http_client() -> httpx.Client:
+    """Get the shared keep-alive client used for all GovInfo requests.
+
+    HTTP/2 lets concurrent page fetches multiplex over one connection.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(
+            timeout=30.0,
+            http2=True,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+        )
+        atexit.register(_http_client.close)
+    return _http_client
+
+
 def build_search_query(start_date: str, end_date: str, offset: int = 0) -> dict:
     return {
         "query": f"publishdate:range({start_date},{end_date})",
@@ -52,18 +81,61 @@ def build_search_query(start_date: str, end_date: str, offset: int = 0) -> dict:
     }
 
 
+def retry_delay(resp: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying: Retry-After if given, else jittered backoff."""
+    retry_after = resp.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return min(float(retry_after), MAX_BACKOFF)
+    return min(2**attempt + random.uniform(0, 1), MAX_BACKOFF)
+
+
 def fetch_search_results(
-    client: httpx.Client, start_date: str, end_date: str, offset: int = 0
-) -> dict:
+    client: httpx.Client,
+    start_date: str,
+    end_date: str,
+    offset: int = 0,
+    cached: dict | None = None,
+) -> tuple[dict, dict | None]:
+    """Fetch one search page, revalidating against a cached copy if given.
+
+    Returns the parsed page and, when the server sent ETag/Last-Modified
+    validators, a fresh cache entry to store for the next crawl. Rate-limit
+    and server errors are retried with backoff; other errors raise at once.
+    """
     payload = build_search_query(start_date, end_date, offset)
     headers = {
         "Content-Type": "application/json",
         "Accept": "application/json",
         "User-Agent": "GovInfoCrawler/1.0",
     }
-    resp = client.post(SEARCH_URL, json=payload, headers=headers)
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    for attempt in range(MAX_ATTEMPTS):
+        resp = client.post(SEARCH_URL, json=payload, headers=headers)
+        if resp.status_code not in RETRY_STATUSES or attempt == MAX_ATTEMPTS - 1:
+            break
+        delay = retry_delay(resp, attempt)
+        logger.warning(
+            f"HTTP {resp.status_code} at offset={offset}, retrying in {delay:.1f}s"
+        )
+        time.sleep(delay)
+
+    if resp.status_code == 304 and cached:
+        return json.loads(cached["body"]), None
     resp.raise_for_status()
-    return resp.json()
+
+    # Decode the body once; the same text is parsed and, if cacheable, stored
+    body = resp.text
+    entry = None
+    etag = resp.headers.get("ETag")
+    last_modified = resp.headers.get("Last-Modified")
+    if etag or last_modified:
+        entry = {"etag": etag, "last_modified": last_modified, "body": body}
+    return json.loads(body), entry
 
 
 def parse_document(result: dict, query_date: str) -> Document:
@@ -93,41 +165,105 @@ def parse_document(result: dict, query_date: str) -> Document:
     )
 
 
-def crawl_date_range(start_date: str, end_date: str) -> Iterator[Document]:
-    """Crawl all documents published in the given date range."""
-    offset = 0
-    total_count = None
+def crawl_date_range(
+    start_date: str,
+    end_date: str,
+    concurrency: int = MAX_CONCURRENCY,
+    conn: sqlite3.Connection | None = None,
+) -> Iterator[Document]:
+    """Crawl all documents published in the given date range.
+
+    The first page is fetched on its own to learn the total count, then the
+    remaining pages are fetched concurrently and yielded in offset order. At
+    most ``concurrency`` pages are in flight or waiting to be consumed; the
+    next one is only requested as the consumer takes a page, so a slow
+    consumer holds back the fetching. When ``conn`` is given, pages are
+    revalidated against the crawler_cache table so unchanged pages come back
+    as cheap 304s. Results repeated across overlapping pages are yielded once.
+    """
     query_date = start_date if start_date == end_date else start_date
+    client = get_http_client()
+    cached_pages = load_cached_pages(conn, start_date, end_date) if conn else {}
 
-    with httpx.Client(timeout=30.0) as client:
-        while True:
-            logger.info(f"Fetching offset={offset}...")
-            try:
-                data = fetch_search_results(client, start_date, end_date, offset)
-            except httpx.HTTPStatusError as e:
-                logger.error(f"HTTP error: {e}")
-                break
-
-            results = data.get("resultSet", [])
-            if total_count is None:
-                total_count = data.get("iTotalCount", 0)
-                logger.info(f"Total documents: {total_count}")
-
-            if not results:
-                break
-
-            for result in results:
-                yield parse_document(result, query_date)
+    def fetch_page(offset: int) -> tuple[dict, dict | None]:
+        logger.info(f"Fetching offset={offset}...")
+        return fetch_search_results(
+            client, start_date, end_date, offset, cached_pages.get(offset)
+        )
 
-            offset += 1
-            if offset * PAGE_SIZE >= total_count:
-                break
-            time.sleep(0.5)
+    def store(offset: int, entry: dict | None):
+        # SQLite writes stay on the consuming thread, not the fetch pool
+        if conn and entry:
+            save_cached_page(conn, start_date, end_date, offset, entry)
+
+    seen: set[tuple[str, str | None]] = set()
+
+    def unseen(results: list[dict]) -> Iterator[Document]:
+        for result in results:
+            doc = parse_document(result, query_date)
+            key = (doc.package_id, doc.granule_id)
+            if key not in seen:
+                seen.add(key)
+                yield doc
+
+    try:
+        data, entry = fetch_page(0)
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error: {e}")
+        return
+    store(0, entry)
+
+    results = data.get("resultSet", [])
+    total_count = data.get("iTotalCount", 0)
+    logger.info(f"Total documents: {total_count}")
+
+    if not results:
+        return
+
+    yield from unseen(results)
+
+    page_count = -(-total_count // PAGE_SIZE)
+    if page_count <= 1:
+        return
+
+    offsets = iter(range(1, page_count))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+
+        def submit(offset: int) -> tuple[int, Future]:
+            return offset, pool.submit(fetch_page, offset)
+
+        in_flight = deque(map(submit, islice(offsets, concurrency)))
+        try:
+            while in_flight:
+                offset, future = in_flight.popleft()
+                # Top the window back up as each page is taken
+                in_flight.extend(map(submit, islice(offsets, 1)))
+                try:
+                    data, entry = future.result()
+                except httpx.HTTPStatusError as e:
+                    logger.error(f"HTTP error: {e}")
+                    break
+                store(offset, entry)
+
+                results = data.get("resultSet", [])
+                if not results:
+                    break
+
+                yield from unseen(results)
+        finally:
+            for _, future in in_flight:
+                future.cancel()
 
 
 def init_db(db_path: Path) -> sqlite3.Connection:
     db_path.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(db_path)
+    # Larger statement cache keeps the upsert/cache queries compiled across chunks
+    conn = sqlite3.connect(db_path, cached_statements=256)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")  # 64 MiB
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MiB
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS documents (
@@ -151,74 +287,219 @@ def init_db(db_path: Path) -> sqlite3.Connection:
         "CREATE INDEX IF NOT EXISTS idx_publish_date ON documents(publish_date)"
     )
     conn.execute("CREATE INDEX IF NOT EXISTS idx_doc_class ON documents(doc_class)")
+    # Lets sync_from_sqlite range-scan rows past its high-water mark
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawled_at ON documents(crawled_at)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS crawler_cache (
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            page_offset INTEGER NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            body TEXT NOT NULL,
+            fetched_at TEXT NOT NULL,
+            PRIMARY KEY (start_date, end_date, page_offset)
+        )
+    """
+    )
+    # Newest crawled_at already uploaded to Supabase, per publish date
+    # ('*' for whole-table syncs)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            date TEXT PRIMARY KEY,
+            last_synced_at TEXT NOT NULL
+        )
+    """
+    )
     conn.commit()
     return conn
 
 
+# ON CONFLICT updates in place; INSERT OR REPLACE deletes and reinserts.
+# Rows whose content didn't change are left alone, crawled_at included, so a
+# recrawl doesn't rewrite them or push them past the sync high-water mark
+SQL_INSERT_DOC = """
+    INSERT INTO documents
+        (package_id, granule_id, title, doc_class, publish_date, metadata,
+         pdf_url, html_url, details_url, summary, crawled_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(package_id, granule_id) DO UPDATE SET
+        title = excluded.title,
+        doc_class = excluded.doc_class,
+        publish_date = excluded.publish_date,
+        metadata = excluded.metadata,
+        pdf_url = excluded.pdf_url,
+        html_url = excluded.html_url,
+        details_url = excluded.details_url,
+        summary = excluded.summary,
+        crawled_at = excluded.crawled_at
+    WHERE excluded.crawled_at > documents.crawled_at
+      AND (excluded.title, excluded.doc_class, excluded.publish_date,
+           excluded.metadata, excluded.pdf_url, excluded.html_url,
+           excluded.details_url, excluded.summary)
+          IS NOT (documents.title, documents.doc_class, documents.publish_date,
+                  documents.metadata, documents.pdf_url, documents.html_url,
+                  documents.details_url, documents.summary)
+"""
+
+
 def save_documents(conn: sqlite3.Connection, docs: list[Document], crawled_at: str):
-    for doc in docs:
-        conn.execute(
-            """INSERT OR REPLACE INTO documents 
-               (package_id, granule_id, title, doc_class, publish_date, metadata, 
-                pdf_url, html_url, details_url, summary, crawled_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                doc.package_id,
-                doc.granule_id,
-                doc.title,
-                doc.doc_class,
-                doc.publish_date,
-                doc.metadata,
-                doc.pdf_url,
-                doc.html_url,
-                doc.details_url,
-                doc.summary,
-                crawled_at,
-            ),
+    """Upsert documents in a single transaction."""
+    rows = (
+        (
+            doc.package_id,
+            doc.granule_id,
+            doc.title,
+            doc.doc_class,
+            doc.publish_date,
+            doc.metadata,
+            doc.pdf_url,
+            doc.html_url,
+            doc.details_url,
+            doc.summary,
+            crawled_at,
         )
-    conn.commit()
+        for doc in docs
+    )
+    with conn:
+        conn.executemany(SQL_INSERT_DOC, rows)
+
+
+def load_cached_pages(
+    conn: sqlite3.Connection, start_date: str, end_date: str
+) -> dict[int, dict]:
+    """Load cached search pages for a date range, keyed by page offset."""
+    rows = conn.execute(
+        """SELECT page_offset, etag, last_modified, body FROM crawler_cache
+           WHERE start_date = ? AND end_date = ?""",
+        (start_date, end_date),
+    ).fetchall()
+    return {
+        offset: {"etag": etag, "last_modified": last_modified, "body": body}
+        for offset, etag, last_modified, body in rows
+    }
+
+
+def save_cached_page(
+    conn: sqlite3.Connection, start_date: str, end_date: str, offset: int, entry: dict
+):
+    conn.execute(
+        """INSERT OR REPLACE INTO crawler_cache
+           (start_date, end_date, page_offset, etag, last_modified, body, fetched_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        (
+            start_date,
+            end_date,
+            offset,
+            entry["etag"],
+            entry["last_modified"],
+            entry["body"],
+            datetime.now().isoformat(),
+        ),
+    )
 
 
-def crawl_day(date: str, db_path: Path | None = None) -> list[Document]:
+def crawl_chunks(
+    start_date: str,
+    end_date: str,
+    db_path: Path | None = None,
+    bulk: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+    crawled_at: str | None = None,
+) -> Iterator[list[Document]]:
+    """Crawl a date range into SQLite, yielding each chunk once it is saved.
+
+    Only one chunk of documents is held in memory at a time. Each chunk is
+    committed before it is yielded, so whatever a consumer does with it
+    (e.g. uploading) the local copy is already durable. Pass ``crawled_at``
+    to stamp the rows with a timestamp the consumer also uses.
+
+    With ``bulk``, journaling and fsyncs are turned off for the duration of
+    the load (WAL/NORMAL are restored afterwards, even on error). A crash
+    mid-load can then corrupt the database, so only use it for rebuilds.
+    """
     if db_path is None:
         db_path = DEFAULT_DB_PATH
-    logger.info(f"Crawling documents for {date}...")
     conn = init_db(db_path)
-    docs = list(crawl_date_range(date, date))
-    logger.info(f"Found {len(docs)} documents")
-    save_documents(conn, docs, datetime.now().isoformat())
-    conn.close()
+    if bulk:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+    try:
+        if crawled_at is None:
+            crawled_at = datetime.now().isoformat()
+        docs = crawl_date_range(start_date, end_date, conn=conn)
+        while chunk := list(islice(docs, chunk_size)):
+            save_documents(conn, chunk, crawled_at)
+            yield chunk
+    finally:
+        if bulk:
+            conn.commit()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.close()
+
+
+def crawl_day(date: str, db_path: Path | None = None) -> int:
+    """Crawl a single day into SQLite. Returns the number of documents."""
+    if db_path is None:
+        db_path = DEFAULT_DB_PATH
+    logger.info(f"Crawling documents for {date}...")
+    count = sum(len(chunk) for chunk in crawl_chunks(date, date, db_path))
+    logger.info(f"Found {count} documents")
     logger.info(f"Saved to {db_path}")
-    return docs
+    return count
 
 
 def crawl_range(
-    start_date: str, end_date: str, db_path: Path | None = None
-) -> list[Document]:
-    if db_path is None:
-        db_path = DEFAULT_DB_PATH
+    start_date: str, end_date: str, db_path: Path | None = None, bulk: bool = False
+) -> int:
+    """Crawl a date range into SQLite. Returns the number of documents."""
     logger.info(f"Crawling {start_date} to {end_date}...")
-    conn = init_db(db_path)
-    docs = list(crawl_date_range(start_date, end_date))
-    logger.info(f"Found {len(docs)} documents")
-    save_documents(conn, docs, datetime.now().isoformat())
-    conn.close()
-    return docs
+    count = sum(
+        len(chunk) for chunk in crawl_chunks(start_date, end_date, db_path, bulk=bulk)
+    )
+    logger.info(f"Found {count} documents")
+    return count
+
+
+EXPORT_COLUMNS = (
+    "id",
+    "package_id",
+    "granule_id",
+    "title",
+    "doc_class",
+    "publish_date",
+    "metadata",
+    "pdf_url",
+    "html_url",
+    "details_url",
+    "summary",
+    "crawled_at",
+)
 
 
 def export_to_json(db_path: Path, output_path: Path, date: str | None = None):
+    """Stream documents to a JSON array; SQLite encodes each row as JSON."""
     conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    fields = ", ".join(f"'{col}', {col}" for col in EXPORT_COLUMNS)
+    sql = f"SELECT json_object({fields}) FROM documents"
     if date:
-        rows = conn.execute(
-            "SELECT * FROM documents WHERE publish_date = ?", (date,)
-        ).fetchall()
+        cursor = conn.execute(sql + " WHERE publish_date = ?", (date,))
     else:
-        rows = conn.execute("SELECT * FROM documents").fetchall()
+        cursor = conn.execute(sql)
+    count = 0
     with open(output_path, "w") as f:
-        json.dump([dict(r) for r in rows], f, indent=2)
+        f.write("[")
+        for (row,) in cursor:
+            if count:
+                f.write(",\n")
+            f.write(row)
+            count += 1
+        f.write("]")
     conn.close()
-    logger.info(f"Exported {len(rows)} documents")
+    logger.info(f"Exported {count} documents")
 
 
 def main():
@@ -232,6 +513,11 @@ def main():
     parser.add_argument("--yesterday", action="store_true")
     parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH)
     parser.add_argument("--export", type=Path, help="Export to JSON")
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Disable journaling/fsync while loading a date range (rebuilds only)",
+    )
     args = parser.parse_args()
 
     if args.export:
@@ -241,7 +527,7 @@ def main():
     elif args.yesterday:
         crawl_day((datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d"), args.db)
     elif args.start_date and args.end_date:
-        crawl_range(args.start_date, args.end_date, args.db)
+        crawl_range(args.start_date, args.end_date, args.db, bulk=args.bulk)
     elif args.date:
         crawl_day(args.date, args.db)
     else:
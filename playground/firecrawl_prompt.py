@@ -1,17 +1,29 @@
 # pip install firecrawl-py
 # uv run python playground/firecrawl_prompt.py
 # uv run python playground/firecrawl_prompt.py --custom
+# uv run python playground/firecrawl_prompt.py --batch 2026-01-29
 
 
 from enum import Enum
+import hashlib
+import json
 import os
+import sys
 import time
+from pathlib import Path
 
 from dotenv import load_dotenv
 
 from firecrawl import Firecrawl
+from firecrawl.v2.types import Document
 from pydantic import BaseModel
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from crawler.govinfo import crawl_date_range
+
+# Scrape results keyed by (url, schema, prompt); delete the directory to refresh
+CACHE_DIR = Path(__file__).parent / ".fc_cache"
+
 def get_firecrawl_client() -> Firecrawl:
     load_dotenv()
     api_key = os.environ.get("FIRECRAWL_API_KEY", "")
@@ -19,6 +31,55 @@ def get_firecrawl_client() -> Firecrawl:
         raise ValueError("FIRECRAWL_API_KEY is not set")
     return Firecrawl(api_key=api_key)
 
+
+def cache_path(url: str, schema: dict, prompt: str) -> Path:
+    key_data = json.dumps([url, schema, prompt], sort_keys=True)
+    key = hashlib.blake2b(key_data.encode(), digest_size=16).hexdigest()
+    return CACHE_DIR / f"{key}.json"
+
+
+def cached_scrape(url: str, schema: dict, prompt: str) -> Document:
+    """Run a JSON-format scrape, reusing the on-disk result for identical requests."""
+    path = cache_path(url, schema, prompt)
+    if path.exists():
+        return Document.model_validate_json(path.read_text())
+
+    firecrawl = get_firecrawl_client()
+    doc = firecrawl.scrape(
+        url,
+        formats=[{"type": "json", "schema": schema, "prompt": prompt}],
+    )
+    CACHE_DIR.mkdir(exist_ok=True)
+    path.write_text(doc.model_dump_json())
+    return doc
+
+
+def cached_batch_scrape(urls: list[str], schema: dict, prompt: str) -> list[Document]:
+    """Scrape all uncached ``urls`` in a single Firecrawl batch job."""
+    paths = {url: cache_path(url, schema, prompt) for url in urls}
+    docs = [
+        Document.model_validate_json(path.read_text())
+        for path in paths.values()
+        if path.exists()
+    ]
+    misses = [url for url, path in paths.items() if not path.exists()]
+    if not misses:
+        return docs
+
+    firecrawl = get_firecrawl_client()
+    job = firecrawl.batch_scrape(
+        misses,
+        formats=[{"type": "json", "schema": schema, "prompt": prompt}],
+        poll_interval=5,
+    )
+    CACHE_DIR.mkdir(exist_ok=True)
+    for doc in job.data:
+        url = doc.metadata.source_url if doc.metadata else None
+        if url in paths:
+            paths[url].write_text(doc.model_dump_json())
+        docs.append(doc)
+    return docs
+
 class Sector(Enum):
     HEALTHCARE = "healthcare"
     FINANCE = "finance"
@@ -48,22 +109,21 @@ class StructuredOutput(BaseModel):
 class SummaryOutput(BaseModel):
     summary: str
 
+
+STRUCTURED_SCHEMA = StructuredOutput.model_json_schema()
+SUMMARY_SCHEMA = SummaryOutput.model_json_schema()
+
+
 def scrape_govinfo_example():
-    firecrawl = get_firecrawl_client()
     # Scrape a website:
     start_time = time.perf_counter()
-    doc = firecrawl.scrape(
+    doc = cached_scrape(
         "https://www.govinfo.gov/content/pkg/FR-2026-01-29/html/2026-01817.htm",
-        formats=[
-            {
-                "type": "json",
-                "schema": StructuredOutput.model_json_schema(),
-                "prompt": """Analyze the provided document to extract key business insights, including:
+        schema=STRUCTURED_SCHEMA,
+        prompt="""Analyze the provided document to extract key business insights, including:
 - All mentioned companies, stakeholders, and relevant regulatory or market deadlines.
 - A clear, structured summary with bold bullet points outlining the main new policies, grouped by sector.
 Rephrase the summary so it's easily understandable for a business audience. Also, rephrase the title to clearly reflect the nature of the document (e.g., product update, service change, regulation shift).""",
-            }
-        ],
     )
     elapsed = time.perf_counter() - start_time
     print(doc)
@@ -75,23 +135,27 @@ KEYWORDS="drugs, healthcare, pharmaceutical"
 CUSTOM_PROMPT = f"""My company operates in the {COMPANY_TYPE} sector and seeks key business insights. Summarize this document, highlighting the most relevant information and explaining its potential impact on my business. Focus on {KEYWORDS} and provide actionable takeaways for decision-making."""
 
 def scrape_custom_example():
-    firecrawl = get_firecrawl_client()
     start_time = time.perf_counter()
-    doc = firecrawl.scrape(
+    doc = cached_scrape(
         "https://www.govinfo.gov/content/pkg/FR-2026-01-29/html/2026-01817.htm",
-        formats=[
-            {
-                "type": "json",
-                "schema": SummaryOutput.model_json_schema(),
-                "prompt": CUSTOM_PROMPT,
-            }
-        ],
+        schema=SUMMARY_SCHEMA,
+        prompt=CUSTOM_PROMPT,
     )
     elapsed = time.perf_counter() - start_time
     print(doc)
     print(f"Request took {elapsed:.2f}s")
 
 
+def scrape_batch_example(date: str):
+    urls = [doc.html_url for doc in crawl_date_range(date, date) if doc.html_url]
+    start_time = time.perf_counter()
+    docs = cached_batch_scrape(urls, schema=SUMMARY_SCHEMA, prompt=CUSTOM_PROMPT)
+    elapsed = time.perf_counter() - start_time
+    for doc in docs:
+        print(doc.json)
+    print(f"Scraped {len(docs)}/{len(urls)} documents in {elapsed:.2f}s")
+
+
 if __name__ == "__main__":
     import argparse
 
@@ -101,9 +165,16 @@ if __name__ == "__main__":
         action="store_true",
         help="Use the custom prompt + summary-only schema",
     )
+    parser.add_argument(
+        "--batch",
+        metavar="DATE",
+        help="Batch-scrape every HTML document published on DATE (YYYY-MM-DD)",
+    )
     args = parser.parse_args()
 
-    if args.custom:
+    if args.batch:
+        scrape_batch_example(args.batch)
+    elif args.custom:
         scrape_custom_example()
     else:
         scrape_govinfo_example()
@@ -1,11 +1,12 @@
-"""Backfill embeddings by triggering updates on extractions without them.
+"""Backfill embeddings by calling the edge function on extractions without them.
 
-Since gte-small runs in the edge function, we just need to trigger an update
-on each row to invoke the webhook.
+Since gte-small runs in the edge function, we send it each batch of rows
+directly (one request per batch) instead of triggering the webhook per row.
 """
 
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import httpx
 from dotenv import load_dotenv
 from supabase import create_client
@@ -23,37 +24,36 @@ SUPABASE_ANON_KEY = os.environ["SUPABASE_ANON_KEY"]
 
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-BATCH_SIZE = 50
+BATCH_SIZE = 50  # rows per edge function call
+MAX_CONCURRENCY = 8  # edge function calls in flight
+FETCH_SIZE = BATCH_SIZE * MAX_CONCURRENCY
 
 
-def call_edge_function(extraction_id: int, summary: str) -> bool:
-    """Call the generate-embedding edge function directly."""
+def call_edge_function(client: httpx.Client, rows: list[dict]) -> list[int]:
+    """Call the generate-embedding edge function for a batch of extractions.
+
+    Returns the ids the function generated embeddings for.
+    """
     url = f"{SUPABASE_URL}/functions/v1/generate-embedding"
     headers = {
         "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
         "Content-Type": "application/json",
     }
     payload = {
-        "type": "UPDATE",
-        "table": "extractions",
-        "record": {
-            "id": extraction_id,
-            "summary": summary,
-            "summary_embedding": None,
-        },
-        "old_record": None,
+        "records": [{"id": row["id"], "summary": row["summary"]} for row in rows],
     }
 
     try:
-        response = httpx.post(url, json=payload, headers=headers, timeout=30)
+        response = client.post(url, json=payload, headers=headers)
         response.raise_for_status()
-        return True
+        return response.json().get("ids", [])
     except Exception as e:
-        logger.error(f"Failed to call edge function for {extraction_id}: {e}")
-        return False
+        ids = [row["id"] for row in rows]
+        logger.error(f"Failed to call edge function for {ids}: {e}")
+        return []
 
 
-def backfill():
+def backfill(client: httpx.Client):
     """Backfill embeddings for extractions without them."""
     # Get extractions without embeddings
     result = (
@@ -61,7 +61,7 @@ def backfill():
         .select("id, summary")
         .is_("summary_embedding", "null")
         .not_.is_("summary", "null")
-        .limit(BATCH_SIZE)
+        .limit(FETCH_SIZE)
         .execute()
     )
 
@@ -69,20 +69,27 @@ def backfill():
         logger.info("No extractions to backfill")
         return 0
 
+    # Each edge function call embeds one batch; run several batches at once
+    rows = result.data
+    batches = [rows[i : i + BATCH_SIZE] for i in range(0, len(rows), BATCH_SIZE)]
+
     count = 0
-    for row in result.data:
-        if call_edge_function(row["id"], row["summary"]):
-            count += 1
-            logger.info(f"Generated embedding for extraction {row['id']}")
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as pool:
+        for ids in pool.map(lambda batch: call_edge_function(client, batch), batches):
+            if ids:
+                count += len(ids)
+                logger.info(f"Generated embeddings for extractions {ids}")
 
     return count
 
 
 if __name__ == "__main__":
     total = 0
-    while True:
-        processed = backfill()
-        total += processed
-        if processed < BATCH_SIZE:
-            break
+    # One client for the whole run so edge function calls reuse the connection
+    with httpx.Client(timeout=120) as client:
+        while True:
+            processed = backfill(client)
+            total += processed
+            if processed < FETCH_SIZE:
+                break
     logger.info(f"Done. Total processed: {total}")
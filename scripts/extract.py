@@ -8,6 +8,7 @@ Usage:
     uv run python scripts/extract.py
     uv run python scripts/extract.py --limit 100
     uv run python scripts/extract.py --date 2026-01-30
+    uv run python scripts/extract.py --poll-interval 30
 """
 
 import json
@@ -23,20 +24,17 @@ from pydantic import BaseModel
 from supabase import create_client, Client
 
 
-def to_serializable(obj):
-    """Convert firecrawl objects to JSON-serializable dicts."""
+def as_dict(obj) -> dict:
+    """View a firecrawl object (pydantic model, plain object or dict) as a dict."""
     if obj is None:
-        return None
-    if isinstance(obj, (str, int, float, bool)):
-        return obj
-    if isinstance(obj, (list, tuple)):
-        return [to_serializable(i) for i in obj]
+        return {}
     if isinstance(obj, dict):
-        return {k: to_serializable(v) for k, v in obj.items()}
+        return obj
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
     if hasattr(obj, "__dict__"):
-        return {k: to_serializable(v) for k, v in obj.__dict__.items()}
-    # Fallback: try str
-    return str(obj)
+        return obj.__dict__
+    return {}
 
 
 load_dotenv()
@@ -48,6 +46,8 @@ logger = logging.getLogger(__name__)
 
 # Firecrawl limits
 BATCH_SIZE = 50  # firecrawl batch limit per request
+PAGE_SIZE = 1000  # PostgREST max rows per response
+POLL_INTERVAL = 10  # seconds between batch status checks
 
 
 class Sector(str, Enum):
@@ -77,6 +77,8 @@ class StructuredOutput(BaseModel):
     summary: str
 
 
+STRUCTURED_SCHEMA = StructuredOutput.model_json_schema()
+
 EXTRACTION_PROMPT = """Analyze the provided document to extract key business insights, including:
 - All mentioned companies, stakeholders, and relevant regulatory or market deadlines.
 - A clear, structured summary with bold bullet points outlining the main new policies, grouped by sector.
@@ -106,49 +108,42 @@ def fetch_unprocessed_documents(
     date: str | None = None,
     include_processed: bool = False,
 ) -> list[dict]:
-    """Fetch documents that haven't been extracted yet."""
-    # Left join to find documents without extractions
-    query = (
-        supabase.table("documents")
-        .select("id, html_url, publish_date")
-        .not_.is_("html_url", "null")
-    )
+    """Fetch documents that haven't been extracted yet.
 
-    if date:
-        query = query.eq("publish_date", date)
+    Reads PAGE_SIZE rows at a time with ``range`` so large backfills aren't
+    cut off by the PostgREST row cap.
+    """
 
-    # Only get docs without extractions - we'll filter in Python
-    # since Supabase doesn't support NOT EXISTS easily
-    if limit:
-        query = query.limit(limit)
-
-    result = query.execute()
-    docs = result.data
-
-    if not docs:
-        return []
-
-    if include_processed:
-        return docs
-
-    # Get existing extraction document_ids
-    doc_ids = [d["id"] for d in docs]
-    existing = (
-        supabase.table("extractions")
-        .select("document_id")
-        .in_("document_id", doc_ids)
-        .execute()
-    )
-    existing_ids = {e["document_id"] for e in existing.data}
-
-    # Filter out already processed
-    unprocessed = [d for d in docs if d["id"] not in existing_ids]
-    return unprocessed
+    def build_query():
+        if not include_processed:
+            # Anti-join runs in Postgres; see the unprocessed_documents migration
+            return supabase.rpc(
+                "unprocessed_documents", {"p_limit": None, "p_date": date}
+            )
+        query = (
+            supabase.table("documents")
+            .select("id, html_url, publish_date")
+            .not_.is_("html_url", "null")
+            .order("id")
+        )
+        if date:
+            query = query.eq("publish_date", date)
+        return query
+
+    docs: list[dict] = []
+    while limit is None or len(docs) < limit:
+        size = PAGE_SIZE if limit is None else min(PAGE_SIZE, limit - len(docs))
+        page = build_query().range(len(docs), len(docs) + size - 1).execute().data
+        docs.extend(page)
+        if len(page) < size:
+            break
+    return docs
 
 
 def run_batch_extraction(
     firecrawl: Firecrawl,
     urls: list[str],
+    poll_interval: int = POLL_INTERVAL,
 ) -> dict:
     """Run firecrawl batch scrape with structured extraction."""
     logger.info(f"Starting batch extraction for {len(urls)} URLs...")
@@ -158,11 +153,11 @@ def run_batch_extraction(
         formats=[
             {
                 "type": "json",
-                "schema": StructuredOutput.model_json_schema(),
+                "schema": STRUCTURED_SCHEMA,
                 "prompt": EXTRACTION_PROMPT,
             }
         ],
-        poll_interval=5,
+        poll_interval=poll_interval,
     )
 
     return result
@@ -188,6 +183,7 @@ def extract_documents(
     limit: int | None = None,
     date: str | None = None,
     include_processed: bool = False,
+    poll_interval: int = POLL_INTERVAL,
 ) -> int:
     """Main extraction pipeline."""
     supabase = get_supabase_client()
@@ -215,48 +211,32 @@ def extract_documents(
         url_to_doc = {d["html_url"]: d for d in batch}
 
         try:
-            result = run_batch_extraction(firecrawl, urls)
+            result = run_batch_extraction(firecrawl, urls, poll_interval)
 
             if result.status != "completed":
                 logger.error(f"Batch failed with status: {result.status}")
                 continue
 
             # Map results back to documents
-            logger.debug(f"Result type: {type(result)}")
-            logger.debug(f"Result attrs: {dir(result)}")
             logger.info(
                 f"Batch status: {result.status}, total: {getattr(result, 'total', '?')}, completed: {getattr(result, 'completed', '?')}"
             )
 
+            # All items come from the same firecrawl job; share one timestamp
+            extracted_at = datetime.now().isoformat()
             extractions = []
             for idx, item in enumerate(result.data):
-                # Debug: log the item structure
-                logger.debug(f"Item {idx} type: {type(item)}")
-                logger.debug(f"Item {idx} attrs: {dir(item)}")
-                if hasattr(item, "__dict__"):
-                    logger.info(f"Item {idx} dict keys: {list(item.__dict__.keys())}")
-
-                # firecrawl returns Document objects, not dicts
-                metadata = getattr(item, "metadata", None)
-                logger.debug(
-                    f"Item {idx} metadata type: {type(metadata)}, value: {metadata}"
+                # Normalize once; everything below is plain dict access
+                data = as_dict(item)
+                metadata = as_dict(data.get("metadata"))
+                json_data = as_dict(data.get("json"))
+
+                url = (
+                    metadata.get("sourceURL")
+                    or metadata.get("source_url")
+                    or data.get("url")
+                    or data.get("sourceURL")
                 )
-
-                # Try different ways to get the URL
-                url = None
-                if isinstance(metadata, dict):
-                    url = metadata.get("sourceURL")
-                elif metadata is not None:
-                    url = getattr(metadata, "sourceURL", None)
-                    if url is None:
-                        url = getattr(metadata, "source_url", None)
-                    if url is None and hasattr(metadata, "__dict__"):
-                        logger.info(f"Item {idx} metadata dict: {metadata.__dict__}")
-
-                # Also check for url directly on item
-                if url is None:
-                    url = getattr(item, "url", None) or getattr(item, "sourceURL", None)
-
                 logger.info(f"Item {idx} resolved URL: {url}")
 
                 if not url or url not in url_to_doc:
@@ -265,44 +245,18 @@ def extract_documents(
                     continue
 
                 doc = url_to_doc[url]
-                json_data = getattr(item, "json", {}) or {}
-
                 extractions.append(
                     {
                         "document_id": doc["id"],
-                        "title": (
-                            json_data.get("title")
-                            if isinstance(json_data, dict)
-                            else getattr(json_data, "title", None)
-                        ),
-                        "companies_mentioned": (
-                            json_data.get("companies_mentioned", [])
-                            if isinstance(json_data, dict)
-                            else getattr(json_data, "companies_mentioned", [])
-                        ),
-                        "sectors": [
-                            s.value if hasattr(s, "value") else s
-                            for s in (
-                                json_data.get("sector", [])
-                                if isinstance(json_data, dict)
-                                else getattr(json_data, "sector", [])
-                            )
-                        ],
-                        "relevance": [
-                            r.value if hasattr(r, "value") else r
-                            for r in (
-                                json_data.get("relevance", [])
-                                if isinstance(json_data, dict)
-                                else getattr(json_data, "relevance", [])
-                            )
-                        ],
-                        "summary": (
-                            json_data.get("summary")
-                            if isinstance(json_data, dict)
-                            else getattr(json_data, "summary", None)
-                        ),
-                        "raw_json": to_serializable(item),
-                        "extracted_at": datetime.now().isoformat(),
+                        "title": json_data.get("title"),
+                        "companies_mentioned": json_data.get("companies_mentioned", []),
+                        # json_data is decoded JSON, so enum fields are already strings
+                        "sectors": json_data.get("sector", []),
+                        "relevance": json_data.get("relevance", []),
+                        "summary": json_data.get("summary"),
+                        # Typed columns hold the rest; keep only what's needed to replay
+                        "raw_json": {"sourceURL": url, "json": json_data},
+                        "extracted_at": extracted_at,
                     }
                 )
 
@@ -333,6 +287,12 @@ def main():
         action="store_true",
         help="Re-extract documents even if they already have extractions",
     )
+    parser.add_argument(
+        "--poll-interval",
+        type=int,
+        default=POLL_INTERVAL,
+        help=f"Seconds between batch status checks (default: {POLL_INTERVAL})",
+    )
 
     args = parser.parse_args()
 
@@ -345,6 +305,7 @@ def main():
         limit=args.limit,
         date=date,
         include_processed=args.rerun,
+        poll_interval=args.poll_interval,
     )
     elapsed = time.perf_counter() - start_time
     logger.info(f"Extraction complete. Processed {count} documents in {elapsed:.2f}s.")
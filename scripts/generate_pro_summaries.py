@@ -9,12 +9,15 @@ Usage:
     uv run python scripts/generate_pro_summaries.py --date 2026-01-31
     uv run python scripts/generate_pro_summaries.py --limit 10
     uv run python scripts/generate_pro_summaries.py --dry-run
+    uv run python scripts/generate_pro_summaries.py --concurrency 16
 """
 
 import os
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 
 from dotenv import load_dotenv
 from firecrawl import Firecrawl
@@ -31,15 +34,23 @@ logger = logging.getLogger(__name__)
 SUPABASE_URL = os.environ["SUPABASE_URL"]
 SUPABASE_KEY = os.environ["SUPABASE_KEY"]
 
+MAX_CONCURRENCY = 8  # Firecrawl scrapes in flight at once
+UPDATE_BATCH_SIZE = 50  # summaries written per upsert
+
 
 class SummaryOutput(BaseModel):
     summary: str
 
 
+SUMMARY_SCHEMA = SummaryOutput.model_json_schema()
+
+
+@lru_cache(maxsize=1)
 def get_supabase_client() -> Client:
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
+@lru_cache(maxsize=1)
 def get_firecrawl_client() -> Firecrawl:
     api_key = os.environ.get("FIRECRAWL_API_KEY", "")
     if not api_key:
@@ -106,7 +117,7 @@ def generate_summary(
             formats=[
                 {
                     "type": "json",
-                    "schema": SummaryOutput.model_json_schema(),
+                    "schema": SUMMARY_SCHEMA,
                     "prompt": prompt,
                 }
             ],
@@ -133,17 +144,18 @@ def generate_summary(
         return None
 
 
-def update_extraction_summary(
-    supabase: Client, extraction_id: int, summary: str
-) -> bool:
-    """Update the summary field for an extraction."""
+def save_extraction_summaries(supabase: Client, rows: list[dict]) -> bool:
+    """Write a batch of summaries to extractions_pro in one upsert.
+
+    Rows carry the NOT NULL key columns alongside ``summary`` so the upsert
+    can resolve on ``id``; other columns are left untouched.
+    """
     try:
-        supabase.table("extractions_pro").update({"summary": summary}).eq(
-            "id", extraction_id
-        ).execute()
+        supabase.table("extractions_pro").upsert(rows, on_conflict="id").execute()
         return True
     except Exception as e:
-        logger.error(f"Failed to update extraction {extraction_id}: {e}")
+        ids = [row["id"] for row in rows]
+        logger.error(f"Failed to save summaries for extractions {ids}: {e}")
         return False
 
 
@@ -151,8 +163,14 @@ def generate_pro_summaries(
     period_date: str | None = None,
     limit: int | None = None,
     dry_run: bool = False,
+    concurrency: int = MAX_CONCURRENCY,
 ) -> dict:
-    """Main function to generate pro summaries."""
+    """Main function to generate pro summaries.
+
+    Firecrawl calls run on a thread pool (``concurrency`` at a time); results
+    are written back to Supabase from the calling thread in batches of
+    UPDATE_BATCH_SIZE.
+    """
     supabase = get_supabase_client()
     firecrawl = get_firecrawl_client()
 
@@ -165,6 +183,7 @@ def generate_pro_summaries(
     logger.info(f"Found {len(extractions)} extractions to process")
 
     stats = {"processed": 0, "success": 0, "errors": 0}
+    pending = []
 
     for ext in extractions:
         extraction_id = ext["id"]
@@ -197,20 +216,45 @@ def generate_pro_summaries(
             stats["success"] += 1
             continue
 
-        summary = generate_summary(firecrawl, html_url, company_type, keywords)
-        stats["processed"] += 1
+        pending.append((ext, html_url, company_type, keywords))
 
-        if not summary:
-            stats["errors"] += 1
-            continue
+    def summarize(job: tuple) -> tuple[dict, str | None]:
+        ext, html_url, company_type, keywords = job
+        return ext, generate_summary(firecrawl, html_url, company_type, keywords)
 
-        if update_extraction_summary(supabase, extraction_id, summary):
-            stats["success"] += 1
-            logger.info(
-                f"Extraction {extraction_id}: summary saved ({len(summary)} chars)"
-            )
+    rows: list[dict] = []
+
+    def flush():
+        if save_extraction_summaries(supabase, rows):
+            stats["success"] += len(rows)
+            logger.info(f"Saved {len(rows)} summaries")
         else:
-            stats["errors"] += 1
+            stats["errors"] += len(rows)
+        rows.clear()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ext, summary in pool.map(summarize, pending):
+            stats["processed"] += 1
+
+            if not summary:
+                stats["errors"] += 1
+                continue
+
+            logger.info(f"Extraction {ext['id']}: summary ready ({len(summary)} chars)")
+            rows.append(
+                {
+                    "id": ext["id"],
+                    "subscription_pro_id": ext["subscription_pro_id"],
+                    "document_id": ext["document_id"],
+                    "period_date": ext["period_date"],
+                    "summary": summary,
+                }
+            )
+            if len(rows) >= UPDATE_BATCH_SIZE:
+                flush()
+
+    if rows:
+        flush()
 
     return stats
 
@@ -228,6 +272,12 @@ def main():
         action="store_true",
         help="Don't actually call Firecrawl or update DB",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=MAX_CONCURRENCY,
+        help=f"Parallel Firecrawl requests (default: {MAX_CONCURRENCY})",
+    )
 
     args = parser.parse_args()
 
@@ -235,6 +285,7 @@ def main():
         period_date=args.date,
         limit=args.limit,
         dry_run=args.dry_run,
+        concurrency=args.concurrency,
     )
     logger.info(
         f"Done. Processed: {stats['processed']}, "
@@ -10,15 +10,22 @@ Usage:
 """
 
 import os
+import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from html import escape
+from pathlib import Path
 
 from dotenv import load_dotenv
-import mistune
-from premailer import transform as inline_styles
 import resend
 from supabase import create_client, Client
 
+# Add parent dir to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from common.email_html import md_to_email_html
+from common.resend_client import call_resend
+
 load_dotenv()
 
 logging.basicConfig(
@@ -26,38 +33,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Relevance ordering for threshold comparison
-RELEVANCE_ORDER = {"high": 3, "medium": 2, "low": 1}
-
-# Styles for markdown elements in email
-MARKDOWN_STYLES = """
-<style>
-    .summary ul, .summary ol { margin: 8px 0; padding-left: 20px; }
-    .summary li { margin: 4px 0; color: #333; }
-    .summary p { margin: 8px 0; }
-    .summary strong, .summary b { font-weight: 600; }
-    .summary code { background: #f4f4f4; padding: 2px 6px; border-radius: 3px; font-size: 13px; font-family: monospace; }
-    .summary a { color: #1a73e8; }
-</style>
-"""
-
-
-def md_to_email_html(text: str) -> str:
-    """Convert markdown to email-safe HTML with inline styles."""
-    if not text:
-        return "<p>No summary available.</p>"
-
-    # Convert markdown to HTML
-    html = mistune.html(text)
-
-    # Wrap with class for styling, then inline the styles
-    wrapped = f'{MARKDOWN_STYLES}<div class="summary">{html}</div>'
+FROM_EMAIL = "news-digest@congresssignal.com"
+RESEND_BATCH_SIZE = 100  # max emails per resend.Batch.send call
+SEND_CONCURRENCY = 2  # batch requests in flight; call_resend paces their starts
 
-    try:
-        return inline_styles(wrapped, strip_important=False)
-    except Exception:
-        # Fallback if premailer fails
-        return f"<div>{html}</div>"
+# One digest entry, filled in by render_item_html
+ITEM_TEMPLATE = """
+        <div style="margin-bottom: 24px; padding: 16px; border: 1px solid #e0e0e0; border-radius: 8px;">
+            <h3 style="margin: 0 0 8px 0;">
+                <a href="{url}" style="color: #1a73e8; text-decoration: none;">{title}</a>
+            </h3>
+            <p style="margin: 0 0 8px 0; color: #666; font-size: 14px;">
+                <strong>Sectors:</strong> {sectors} | <strong>Relevance:</strong> {relevance}
+            </p>
+            <p style="margin: 0 0 12px 0; color: #666; font-size: 14px;">
+                <strong>Companies:</strong> {companies}
+            </p>
+            <div style="color: #333; font-size: 14px; line-height: 1.5;">{summary}</div>
+        </div>
+        """
 
 
 def get_supabase_client() -> Client:
@@ -84,95 +78,56 @@ def fetch_active_subscriptions(supabase: Client) -> list[dict]:
 
 def fetch_extractions_for_date(supabase: Client, date: str) -> list[dict]:
     """Fetch all extractions for documents published on a given date."""
-    # Join extractions with documents to filter by publish_date
+    # !inner makes the embed an inner join, so non-matching rows never leave Postgres
     result = (
         supabase.table("extractions")
         .select(
-            "id, document_id, title, companies_mentioned, sectors, relevance, summary, documents(html_url, publish_date)"
+            "id, document_id, title, companies_mentioned, sectors, relevance, summary, documents!inner(html_url, publish_date)"
         )
         .eq("documents.publish_date", date)
         .execute()
     )
-    # Filter out nulls from the join (documents that don't match the date)
-    return [e for e in result.data if e.get("documents")]
-
-
-def matches_threshold(extraction_relevance: list[str], threshold: str) -> bool:
-    """Check if any extraction relevance meets the threshold."""
-    threshold_val = RELEVANCE_ORDER.get(threshold, 2)
-    for rel in extraction_relevance:
-        if RELEVANCE_ORDER.get(rel, 0) >= threshold_val:
-            return True
-    return False
-
-
-def matches_sectors(extraction_sectors: list[str], sub_sectors: list[str]) -> bool:
-    """Check if there's any sector overlap. Empty sub_sectors = match all."""
-    if not sub_sectors:
-        return True
-    return bool(set(extraction_sectors) & set(sub_sectors))
-
-
-def matches_keywords(extraction: dict, keywords: list[str]) -> bool:
-    """Check if any keyword appears in title, summary, or companies. Empty = match all."""
-    if not keywords:
-        return True
-
-    text = " ".join(
-        [
-            extraction.get("title") or "",
-            extraction.get("summary") or "",
-            " ".join(extraction.get("companies_mentioned") or []),
-        ]
-    ).lower()
-
-    return any(kw.lower() in text for kw in keywords)
-
-
-def filter_extractions_for_subscription(
-    extractions: list[dict],
-    subscription: dict,
-) -> list[dict]:
-    """Filter extractions that match a subscription's criteria."""
-    matching = []
-    for ext in extractions:
-        if not matches_threshold(
-            ext.get("relevance", []), subscription.get("relevance_threshold", "medium")
-        ):
-            continue
-        if not matches_sectors(ext.get("sectors", []), subscription.get("sectors", [])):
-            continue
-        if not matches_keywords(ext, subscription.get("keywords", [])):
-            continue
-        matching.append(ext)
-    return matching
+    return result.data
 
 
-def render_email_html(extractions: list[dict], date: str) -> str:
-    """Render email HTML from extractions."""
-    items_html = ""
-    for ext in extractions:
-        docs = ext.get("documents", {})
-        url = docs.get("html_url", "#") if isinstance(docs, dict) else "#"
+def fetch_digest_matches(supabase: Client, date: str) -> dict[int, list[int]]:
+    """Map subscription id -> ids of extractions it should receive for a date.
+
+    Threshold, sector and keyword matching run in Postgres; see the
+    digest_matches migration.
+    """
+    result = supabase.rpc("digest_matches", {"p_date": date}).execute()
+    return {row["subscription_id"]: row["extraction_ids"] for row in result.data}
+
+
+def render_item_html(ext: dict) -> str:
+    """Render one digest entry; the markup is the same for every subscriber."""
+    docs = ext.get("documents", {})
+    url = docs.get("html_url", "#") if isinstance(docs, dict) else "#"
+
+    # relevance is a single enum value since the relevance_single_value migration
+    relevance = ext.get("relevance") or []
+    if isinstance(relevance, str):
+        relevance = [relevance]
+
+    sectors = ", ".join(ext.get("sectors", [])) or "N/A"
+    relevance = ", ".join(relevance) or "N/A"
+    companies = ", ".join(ext.get("companies_mentioned", [])) or "None mentioned"
+
+    # Everything but the summary is plain text from the extraction; escape it
+    return ITEM_TEMPLATE.format(
+        url=escape(url or "#"),
+        title=escape(ext.get("title") or "Untitled"),
+        sectors=escape(sectors),
+        relevance=escape(relevance),
+        companies=escape(companies),
+        summary=md_to_email_html(ext.get("summary", "")),
+    )
 
-        sectors = ", ".join(ext.get("sectors", [])) or "N/A"
-        relevance = ", ".join(ext.get("relevance", [])) or "N/A"
-        companies = ", ".join(ext.get("companies_mentioned", [])) or "None mentioned"
 
-        items_html += f"""
-        <div style="margin-bottom: 24px; padding: 16px; border: 1px solid #e0e0e0; border-radius: 8px;">
-            <h3 style="margin: 0 0 8px 0;">
-                <a href="{url}" style="color: #1a73e8; text-decoration: none;">{ext.get('title', 'Untitled')}</a>
-            </h3>
-            <p style="margin: 0 0 8px 0; color: #666; font-size: 14px;">
-                <strong>Sectors:</strong> {sectors} | <strong>Relevance:</strong> {relevance}
-            </p>
-            <p style="margin: 0 0 12px 0; color: #666; font-size: 14px;">
-                <strong>Companies:</strong> {companies}
-            </p>
-            <div style="color: #333; font-size: 14px; line-height: 1.5;">{md_to_email_html(ext.get('summary', ''))}</div>
-        </div>
-        """
+def render_email_html(items: list[str], date: str) -> str:
+    """Render email HTML from pre-rendered digest entries."""
+    items_html = "".join(items)
 
     return f"""
     <!DOCTYPE html>
@@ -199,30 +154,38 @@ def render_email_html(extractions: list[dict], date: str) -> str:
     """
 
 
-def send_email(to: str, subject: str, html: str, dry_run: bool = False) -> bool:
-    """Send email via Resend."""
+def send_emails(messages: list[dict], dry_run: bool = False) -> int:
+    """Send emails via Resend's batch endpoint; returns how many were accepted."""
     if dry_run:
-        logger.info(f"[DRY RUN] Would send to {to}: {subject}")
-        return True
+        for msg in messages:
+            logger.info(f"[DRY RUN] Would send to {msg['to']}: {msg['subject']}")
+        return len(messages)
 
-    resend.api_key = os.environ.get("RESEND_API_KEY", "")
     if not resend.api_key:
         logger.error("RESEND_API_KEY not set")
-        return False
-
-    try:
-        resend.Emails.send(
-            {
-                "from": "news-digest@congresssignal.com",
-                "to": to,
-                "subject": subject,
-                "html": html,
-            }
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send to {to}: {e}")
-        return False
+        return 0
+
+    def send_batch(batch: list[dict]) -> int:
+        try:
+            # Permissive mode sends the valid emails and reports the rest
+            resp = call_resend(
+                resend.Batch.send, batch, {"batch_validation": "permissive"}
+            )
+        except Exception as e:
+            logger.error(f"Failed to send batch of {len(batch)} emails: {e}")
+            return 0
+        errors = resp.get("errors") or []
+        for err in errors:
+            to = batch[err["index"]]["to"]
+            logger.error(f"Failed to send to {to}: {err['message']}")
+        return len(batch) - len(errors)
+
+    batches = [
+        messages[i : i + RESEND_BATCH_SIZE]
+        for i in range(0, len(messages), RESEND_BATCH_SIZE)
+    ]
+    with ThreadPoolExecutor(max_workers=SEND_CONCURRENCY) as pool:
+        return sum(pool.map(send_batch, batches))
 
 
 def send_digests(date: str | None = None, dry_run: bool = False) -> dict:
@@ -242,25 +205,42 @@ def send_digests(date: str | None = None, dry_run: bool = False) -> dict:
     extractions = fetch_extractions_for_date(supabase, target_date)
     logger.info(f"Found {len(extractions)} extractions for {target_date}")
 
+    by_id = {ext["id"]: ext for ext in extractions}
+    matches = fetch_digest_matches(supabase, target_date)
+
+    # Markdown + CSS inlining is the expensive part; do it once per extraction
+    rendered: dict[int, str] = {}
+
+    def item_html(ext: dict) -> str:
+        if ext["id"] not in rendered:
+            rendered[ext["id"]] = render_item_html(ext)
+        return rendered[ext["id"]]
+
     stats = {"sent": 0, "failed": 0, "skipped": 0}
+    messages = []
 
     for sub in subscriptions:
-        matching = filter_extractions_for_subscription(extractions, sub)
+        matching = [by_id[i] for i in matches.get(sub["id"], []) if i in by_id]
 
         if not matching:
             logger.info(f"No matching extractions for {sub['email']}, skipping")
             stats["skipped"] += 1
             continue
 
-        html = render_email_html(matching, target_date)
-        subject = f"Congress Signal: {len(matching)} updates for {target_date}"
-
-        if send_email(sub["email"], subject, html, dry_run=dry_run):
-            stats["sent"] += 1
-            logger.info(f"Sent digest to {sub['email']} ({len(matching)} items)")
-        else:
-            stats["failed"] += 1
+        messages.append(
+            {
+                "from": FROM_EMAIL,
+                "to": sub["email"],
+                "subject": f"Congress Signal: {len(matching)} updates for {target_date}",
+                "html": render_email_html(
+                    [item_html(ext) for ext in matching], target_date
+                ),
+            }
+        )
+        logger.info(f"Prepared digest for {sub['email']} ({len(matching)} items)")
 
+    stats["sent"] = send_emails(messages, dry_run=dry_run)
+    stats["failed"] = len(messages) - stats["sent"]
     return stats
 
 
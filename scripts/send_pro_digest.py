@@ -11,15 +11,23 @@ Usage:
 """
 
 import os
+import sys
 import logging
+from collections import defaultdict
 from datetime import datetime
+from functools import lru_cache
+from html import escape
+from pathlib import Path
 
 from dotenv import load_dotenv
-import mistune
-from premailer import transform as inline_styles
 import resend
 from supabase import create_client, Client
 
+# Add parent dir to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from common.email_html import md_to_email_html
+from common.resend_client import call_resend
+
 load_dotenv()
 
 logging.basicConfig(
@@ -30,33 +38,22 @@ logger = logging.getLogger(__name__)
 SUPABASE_URL = os.environ["SUPABASE_URL"]
 SUPABASE_KEY = os.environ["SUPABASE_KEY"]
 
-# Styles for markdown elements in email
-MARKDOWN_STYLES = """
-<style>
-    .summary ul, .summary ol { margin: 8px 0; padding-left: 20px; }
-    .summary li { margin: 4px 0; color: #333; }
-    .summary p { margin: 8px 0; }
-    .summary strong, .summary b { font-weight: 600; }
-    .summary code { background: #f4f4f4; padding: 2px 6px; border-radius: 3px; font-size: 13px; font-family: monospace; }
-    .summary a { color: #1a73e8; }
-</style>
-"""
-
+FROM_EMAIL = "pro@congresssignal.com"
+PAGE_SIZE = 1000  # rows per request when paging through extractions_pro
+RESEND_BATCH_SIZE = 100  # max emails per resend.Batch.send call
+ID_CHUNK = 500  # ids per .in_() filter, which travels in the query string
 
-def md_to_email_html(text: str) -> str:
-    """Convert markdown to email-safe HTML with inline styles."""
-    if not text:
-        return "<p>No summary available.</p>"
-
-    html = mistune.html(text)
-    wrapped = f'{MARKDOWN_STYLES}<div class="summary">{html}</div>'
-
-    try:
-        return inline_styles(wrapped, strip_important=False)
-    except Exception:
-        return f"<div>{html}</div>"
+# One digest entry, filled in by render_item_html
+ITEM_TEMPLATE = """
+        <div style="margin-bottom: 28px; padding: 20px; background: #fafbfc; border-left: 4px solid #1a73e8; border-radius: 0 8px 8px 0;">
+            <h3 style="margin: 0 0 12px 0; font-size: 18px; color: #1a1a1a;">{title}</h3>
+            <div style="color: #333; font-size: 14px; line-height: 1.6;">{summary}</div>
+            <a href="{url}" style="display: inline-block; margin-top: 12px; padding: 8px 16px; background: #1a73e8; color: #fff; text-decoration: none; border-radius: 6px; font-size: 13px; font-weight: 500;">View Document →</a>
+        </div>
+        """
 
 
+@lru_cache(maxsize=1)
 def get_supabase_client() -> Client:
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
@@ -73,71 +70,99 @@ def fetch_active_pro_subscriptions(supabase: Client) -> list[dict]:
     return result.data
 
 
-def fetch_unsent_extractions_for_subscription(
+def fetch_unsent_extractions(
     supabase: Client,
-    subscription_id: int,
+    subscription_ids: list[int],
     period_date: str | None = None,
-) -> list[dict]:
+) -> dict[int, list[dict]]:
     """
-    Fetch extractions_pro that have summaries but haven't been sent.
-    Joins with documents for html_url and title.
+    Fetch extractions_pro that have summaries but haven't been sent, for all
+    given subscriptions at once, grouped by subscription id.
+    Joins with documents for html_url and title. Subscription ids are queried
+    ID_CHUNK at a time to keep the URL short.
     """
-    query = (
-        supabase.table("extractions_pro")
-        .select(
-            "id, summary, period_date, "
-            "documents!inner(id, html_url, title, publish_date)"
-        )
-        .eq("subscription_pro_id", subscription_id)
-        .not_.is_("summary", "null")
-        .is_("sent_at", "null")
-    )
-
-    if period_date:
-        query = query.eq("period_date", period_date)
 
-    result = query.execute()
-    return result.data
+    def build_query(ids: list[int]):
+        query = (
+            supabase.table("extractions_pro")
+            .select(
+                "id, subscription_pro_id, summary, period_date, "
+                "documents!inner(id, html_url, title, publish_date)"
+            )
+            .in_("subscription_pro_id", ids)
+            .not_.is_("summary", "null")
+            .is_("sent_at", "null")
+            .order("id")
+        )
+        if period_date:
+            query = query.eq("period_date", period_date)
+        return query
+
+    rows: list[dict] = []
+    for start in range(0, len(subscription_ids), ID_CHUNK):
+        ids = subscription_ids[start : start + ID_CHUNK]
+        # Page through with range so the PostgREST row cap can't truncate the run
+        offset = 0
+        while True:
+            page = build_query(ids).range(offset, offset + PAGE_SIZE - 1).execute()
+            rows.extend(page.data)
+            if len(page.data) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+
+    by_subscription: dict[int, list[dict]] = defaultdict(list)
+    for row in rows:
+        by_subscription[row["subscription_pro_id"]].append(row)
+    return by_subscription
 
 
 def mark_extractions_sent(
     supabase: Client,
     extraction_ids: list[int],
 ) -> bool:
-    """Mark extractions as sent by setting sent_at timestamp."""
+    """Mark extractions as sent by setting sent_at timestamp.
+
+    The ids travel in the query string, so very large runs are split into
+    chunks of ID_CHUNK ids; every chunk gets the same timestamp.
+    """
+    sent_at = datetime.now().isoformat()
     try:
-        supabase.table("extractions_pro").update(
-            {"sent_at": datetime.now().isoformat()}
-        ).in_("id", extraction_ids).execute()
+        for start in range(0, len(extraction_ids), ID_CHUNK):
+            supabase.table("extractions_pro").update({"sent_at": sent_at}).in_(
+                "id", extraction_ids[start : start + ID_CHUNK]
+            ).execute()
         return True
     except Exception as e:
         logger.error(f"Failed to mark extractions as sent: {e}")
         return False
 
 
+def render_item_html(ext: dict) -> str:
+    """Render one pro digest entry."""
+    doc = ext.get("documents", {})
+    if not isinstance(doc, dict):
+        doc = {}
+
+    # Titles and URLs come from scraped data; escape them before interpolating
+    return ITEM_TEMPLATE.format(
+        title=escape(doc.get("title") or "Untitled"),
+        summary=md_to_email_html(ext.get("summary", "")),
+        url=escape(doc.get("html_url") or "#"),
+    )
+
+
 def render_pro_email_html(
     extractions: list[dict],
     subscription: dict,
     period_date: str,
 ) -> str:
     """Render personalized pro email HTML from extractions."""
-    company_type = subscription.get("company_type") or "your industry"
+    # company_type and keywords are free text from the signup form
+    company_type = escape(subscription.get("company_type") or "your industry")
     keywords = subscription.get("keywords") or []
-    keywords_str = ", ".join(keywords) if keywords else "regulatory updates"
+    keywords_str = escape(", ".join(keywords) if keywords else "regulatory updates")
 
-    items_html = ""
-    for ext in extractions:
-        doc = ext.get("documents", {})
-        url = doc.get("html_url", "#") if isinstance(doc, dict) else "#"
-        title = doc.get("title", "Untitled") if isinstance(doc, dict) else "Untitled"
-
-        items_html += f"""
-        <div style="margin-bottom: 28px; padding: 20px; background: #fafbfc; border-left: 4px solid #1a73e8; border-radius: 0 8px 8px 0;">
-            <h3 style="margin: 0 0 12px 0; font-size: 18px; color: #1a1a1a;">{title}</h3>
-            <div style="color: #333; font-size: 14px; line-height: 1.6;">{md_to_email_html(ext.get('summary', ''))}</div>
-            <a href="{url}" style="display: inline-block; margin-top: 12px; padding: 8px 16px; background: #1a73e8; color: #fff; text-decoration: none; border-radius: 6px; font-size: 13px; font-weight: 500;">View Document →</a>
-        </div>
-        """
+    items_html = "".join(render_item_html(ext) for ext in extractions)
 
     return f"""
     <!DOCTYPE html>
@@ -175,30 +200,39 @@ def render_pro_email_html(
     """
 
 
-def send_email(to: str, subject: str, html: str, dry_run: bool = False) -> bool:
-    """Send email via Resend."""
+def send_emails(messages: list[dict], dry_run: bool = False) -> list[bool]:
+    """Send emails via Resend's batch endpoint; returns a success flag per message."""
     if dry_run:
-        logger.info(f"[DRY RUN] Would send to {to}: {subject}")
-        return True
+        for msg in messages:
+            logger.info(f"[DRY RUN] Would send to {msg['to']}: {msg['subject']}")
+        return [True] * len(messages)
 
-    resend.api_key = os.environ.get("RESEND_API_KEY", "")
     if not resend.api_key:
         logger.error("RESEND_API_KEY not set")
-        return False
+        return [False] * len(messages)
+
+    sent = []
+    for start in range(0, len(messages), RESEND_BATCH_SIZE):
+        batch = messages[start : start + RESEND_BATCH_SIZE]
+        try:
+            # Permissive mode sends the valid emails and reports the rest
+            resp = call_resend(
+                resend.Batch.send, batch, {"batch_validation": "permissive"}
+            )
+        except Exception as e:
+            logger.error(f"Failed to send batch of {len(batch)} emails: {e}")
+            sent.extend([False] * len(batch))
+            continue
 
-    try:
-        resend.Emails.send(
-            {
-                "from": "pro@congresssignal.com",
-                "to": to,
-                "subject": subject,
-                "html": html,
-            }
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send to {to}: {e}")
-        return False
+        ok = [True] * len(batch)
+        for err in resp.get("errors") or []:
+            ok[err["index"]] = False
+            logger.error(
+                f"Failed to send to {batch[err['index']]['to']}: {err['message']}"
+            )
+        sent.extend(ok)
+
+    return sent
 
 
 def send_pro_digests(
@@ -218,30 +252,51 @@ def send_pro_digests(
     logger.info(f"Found {len(subscriptions)} active pro subscriptions")
 
     stats = {"sent": 0, "failed": 0, "skipped": 0}
+    messages = []
+    # Extraction ids behind each message, in the same order as messages
+    message_extraction_ids: list[list[int]] = []
+
+    unsent = fetch_unsent_extractions(
+        supabase, [sub["id"] for sub in subscriptions], target_date
+    )
 
     for sub in subscriptions:
-        extractions = fetch_unsent_extractions_for_subscription(
-            supabase, sub["id"], target_date
-        )
+        extractions = unsent.get(sub["id"])
 
         if not extractions:
             logger.info(f"No unsent extractions for {sub['email']}, skipping")
             stats["skipped"] += 1
             continue
 
-        html = render_pro_email_html(extractions, sub, target_date)
-        subject = f"Congress Signal Pro: {len(extractions)} insights for {target_date}"
-
-        if send_email(sub["email"], subject, html, dry_run=dry_run):
-            stats["sent"] += 1
-            logger.info(f"Sent pro digest to {sub['email']} ({len(extractions)} items)")
+        messages.append(
+            {
+                "from": FROM_EMAIL,
+                "to": sub["email"],
+                "subject": f"Congress Signal Pro: {len(extractions)} insights for {target_date}",
+                "html": render_pro_email_html(extractions, sub, target_date),
+            }
+        )
+        message_extraction_ids.append([e["id"] for e in extractions])
+        logger.info(
+            f"Prepared pro digest for {sub['email']} ({len(extractions)} items)"
+        )
 
-            # Mark as sent (unless dry run)
-            if not dry_run:
-                extraction_ids = [e["id"] for e in extractions]
-                mark_extractions_sent(supabase, extraction_ids)
-        else:
-            stats["failed"] += 1
+    # One Resend batch at a time, marking what went out before the next one,
+    # so a failure later in the run can't get earlier recipients emailed twice
+    for start in range(0, len(messages), RESEND_BATCH_SIZE):
+        end = start + RESEND_BATCH_SIZE
+        results = send_emails(messages[start:end], dry_run=dry_run)
+        stats["sent"] += sum(results)
+        stats["failed"] += len(results) - sum(results)
+
+        sent_ids = [
+            ext_id
+            for ok, ids in zip(results, message_extraction_ids[start:end])
+            if ok
+            for ext_id in ids
+        ]
+        if sent_ids and not dry_run:
+            mark_extractions_sent(supabase, sent_ids)
 
     return stats
 
@@ -10,11 +10,15 @@ Usage:
     uv run python scripts/sync_pro_digests.py --date 2026-01-31
     uv run python scripts/sync_pro_digests.py --top-k 5
     uv run python scripts/sync_pro_digests.py --dry-run
+    uv run python scripts/sync_pro_digests.py --concurrency 16
 """
 
 import os
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 
 import httpx
 from dotenv import load_dotenv
@@ -33,8 +37,22 @@ SUPABASE_ANON_KEY = os.environ["SUPABASE_ANON_KEY"]
 
 DEFAULT_TOP_K = 10
 DEFAULT_MATCH_THRESHOLD = 0.5
+MAX_CONCURRENCY = 8  # semantic searches in flight at once
+
+# Shared across semantic-search calls: one HTTP/2 connection, multiplexed
+# across threads, with the edge-function auth headers set once
+SEARCH_CLIENT = httpx.Client(
+    http2=True,
+    timeout=30,
+    limits=httpx.Limits(max_keepalive_connections=20),
+    headers={
+        "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
+        "Content-Type": "application/json",
+    },
+)
 
 
+@lru_cache(maxsize=1)
 def get_supabase_client() -> Client:
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
@@ -74,25 +92,24 @@ def semantic_search(
 ) -> list[dict]:
     """Call the semantic-search edge function."""
     url = f"{SUPABASE_URL}/functions/v1/semantic-search"
-    headers = {
-        "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
-        "Content-Type": "application/json",
-    }
     payload = {
         "query": query,
         "matchCount": match_count,
         "matchThreshold": match_threshold,
     }
 
-    logger.debug(f"Semantic search payload: {payload}")
+    # Lazy %-formatting: these reprs can be large and --debug is usually off
+    logger.debug("Semantic search payload: %s", payload)
 
-    response = httpx.post(url, json=payload, headers=headers, timeout=30)
+    response = SEARCH_CLIENT.post(url, json=payload)
     response.raise_for_status()
 
     data = response.json()
-    logger.debug(f"Semantic search raw response: {data}")
+    logger.debug("Semantic search raw response: %s", data)
     logger.debug(
-        f"Response type: {type(data)}, length: {len(data) if isinstance(data, list) else 'N/A'}"
+        "Response type: %s, length: %s",
+        type(data),
+        len(data) if isinstance(data, list) else "N/A",
     )
 
     return data
@@ -112,21 +129,35 @@ def insert_extractions_pro(
         )
         return len(document_ids)
 
+    rows = [
+        {
+            "subscription_pro_id": subscription_id,
+            "document_id": doc_id,
+            "period_date": period_date,
+        }
+        for doc_id in document_ids
+    ]
+    try:
+        supabase.table("extractions_pro").upsert(
+            rows, on_conflict="subscription_pro_id,document_id,period_date"
+        ).execute()
+        return len(rows)
+    except Exception as e:
+        logger.warning(
+            f"Bulk insert failed for sub {subscription_id}, retrying per row: {e}"
+        )
+
+    # Fall back to one row at a time so a single bad row doesn't lose the rest
     inserted = 0
-    for doc_id in document_ids:
+    for row in rows:
         try:
             supabase.table("extractions_pro").upsert(
-                {
-                    "subscription_pro_id": subscription_id,
-                    "document_id": doc_id,
-                    "period_date": period_date,
-                },
-                on_conflict="subscription_pro_id,document_id,period_date",
+                row, on_conflict="subscription_pro_id,document_id,period_date"
             ).execute()
             inserted += 1
         except Exception as e:
             logger.warning(
-                f"Failed to insert doc {doc_id} for sub {subscription_id}: {e}"
+                f"Failed to insert doc {row['document_id']} for sub {subscription_id}: {e}"
             )
 
     return inserted
@@ -137,8 +168,14 @@ def sync_pro_digests(
     top_k: int = DEFAULT_TOP_K,
     match_threshold: float = DEFAULT_MATCH_THRESHOLD,
     dry_run: bool = False,
+    concurrency: int = MAX_CONCURRENCY,
 ) -> dict:
-    """Main function to sync pro digests."""
+    """Main function to sync pro digests.
+
+    Each distinct search query runs once, on a thread pool (``concurrency``
+    at a time); matches are written to Supabase from the calling thread for
+    every subscription sharing that query as results arrive.
+    """
     supabase = get_supabase_client()
 
     target_date = period_date or datetime.now().strftime("%Y-%m-%d")
@@ -152,31 +189,52 @@ def sync_pro_digests(
 
     stats = {"subscriptions": 0, "documents": 0, "errors": 0}
 
+    # Subscribers with the same company_type + keywords share one search
+    subs_by_query: dict[str, list[dict]] = defaultdict(list)
     for sub in subscriptions:
         query = build_search_query(sub)
         logger.info(f"Subscription {sub['id']} ({sub['email']}): query='{query}'")
+        subs_by_query[query].append(sub)
 
+    logger.info(
+        f"Running {len(subs_by_query)} unique searches for "
+        f"{len(subscriptions)} subscriptions"
+    )
+
+    def search(query: str) -> tuple[str, list[dict] | None]:
         try:
             results = semantic_search(
                 query, match_count=top_k, match_threshold=match_threshold
             )
         except Exception as e:
-            logger.error(f"Semantic search failed for subscription {sub['id']}: {e}")
-            stats["errors"] += 1
-            continue
-
-        if not results:
-            logger.info(f"No matches for subscription {sub['id']}")
-            continue
-
-        document_ids = [r["document_id"] for r in results]
-        inserted = insert_extractions_pro(
-            supabase, sub["id"], document_ids, target_date, dry_run=dry_run
-        )
-
-        stats["subscriptions"] += 1
-        stats["documents"] += inserted
-        logger.info(f"Inserted {inserted} documents for subscription {sub['id']}")
+            logger.error(f"Semantic search failed for query '{query}': {e}")
+            return query, None
+        return query, results
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for query, results in pool.map(search, subs_by_query):
+            subs = subs_by_query[query]
+
+            if results is None:
+                stats["errors"] += len(subs)
+                continue
+
+            if not results:
+                for sub in subs:
+                    logger.info(f"No matches for subscription {sub['id']}")
+                continue
+
+            document_ids = [r["document_id"] for r in results]
+            for sub in subs:
+                inserted = insert_extractions_pro(
+                    supabase, sub["id"], document_ids, target_date, dry_run=dry_run
+                )
+
+                stats["subscriptions"] += 1
+                stats["documents"] += inserted
+                logger.info(
+                    f"Inserted {inserted} documents for subscription {sub['id']}"
+                )
 
     return stats
 
@@ -202,6 +260,12 @@ def main():
         "--dry-run", action="store_true", help="Don't actually insert records"
     )
     parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=MAX_CONCURRENCY,
+        help=f"Semantic searches to run in parallel (default: {MAX_CONCURRENCY})",
+    )
 
     args = parser.parse_args()
 
@@ -213,6 +277,7 @@ def main():
         top_k=args.top_k,
         match_threshold=args.threshold,
         dry_run=args.dry_run,
+        concurrency=args.concurrency,
     )
     logger.info(
         f"Done. Subscriptions processed: {stats['subscriptions']}, "
@@ -8,17 +8,22 @@ Run with:
 
 import os
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import lru_cache
+from html import escape
 
 import httpx
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Depends
 from firecrawl import Firecrawl
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, ValidationError
 from supabase import create_client, Client
 import resend
-import mistune
-from premailer import transform as inline_styles
+
+from common.email_html import md_to_email_html
+from common.resend_client import call_resend
 
 load_dotenv()
 
@@ -27,13 +32,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Congress Signal Pro Webhooks")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared clients at startup so the first webhook doesn't pay for it."""
+    get_supabase()
+    try:
+        get_firecrawl()
+    except ValueError as e:
+        logger.warning(f"{e}; onboarding summaries will fail")
+    yield
+    # Let queued and running onboardings finish before the process exits
+    ONBOARDING_POOL.shutdown(wait=True)
+
+
+app = FastAPI(title="Congress Signal Pro Webhooks", lifespan=lifespan)
 
 # Config
 SUPABASE_URL = os.environ["SUPABASE_URL"]
 SUPABASE_KEY = os.environ["SUPABASE_KEY"]
 SUPABASE_ANON_KEY = os.environ["SUPABASE_ANON_KEY"]
 WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")  # Optional auth
+FIRECRAWL_CONCURRENCY = 4  # pages Firecrawl scrapes at once per onboarding batch
+ONBOARDING_CONCURRENCY = 2  # onboardings run at once; the rest wait in the queue
+
+# Onboardings run here rather than in BackgroundTasks, so a burst of signups
+# queues up instead of each taking a Starlette threadpool worker and firing
+# its own Firecrawl scrapes (at most ONBOARDING_CONCURRENCY x
+# FIRECRAWL_CONCURRENCY scrapes are in flight)
+ONBOARDING_POOL = ThreadPoolExecutor(
+    max_workers=ONBOARDING_CONCURRENCY, thread_name_prefix="onboarding"
+)
+
+# Shared across semantic-search calls: one HTTP/2 connection, multiplexed
+# across threads, with the edge-function auth headers set once
+SEARCH_CLIENT = httpx.Client(
+    http2=True,
+    timeout=30,
+    limits=httpx.Limits(max_keepalive_connections=20),
+    headers={
+        "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
+        "Content-Type": "application/json",
+    },
+)
 
 
 # Pydantic models
@@ -45,26 +86,29 @@ class SubscriptionRecord(BaseModel):
 
 
 class WebhookPayload(BaseModel):
+    model_config = ConfigDict(populate_by_name=True, extra="ignore")
+
     type: str  # INSERT, UPDATE, DELETE
     table: str
-    record: dict
+    record: dict | None = None  # None on DELETE
     old_record: dict | None = None
     schema_: str | None = None
 
-    class Config:
-        populate_by_name = True
-        extra = "ignore"
-
 
 class SummaryOutput(BaseModel):
     summary: str
 
 
-# Clients
+SUMMARY_SCHEMA = SummaryOutput.model_json_schema()
+
+
+# Clients, created once per process and shared across requests
+@lru_cache(maxsize=1)
 def get_supabase() -> Client:
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
+@lru_cache(maxsize=1)
 def get_firecrawl() -> Firecrawl:
     api_key = os.environ.get("FIRECRAWL_API_KEY", "")
     if not api_key:
@@ -73,27 +117,14 @@ def get_firecrawl() -> Firecrawl:
 
 
 # Email helpers
-MARKDOWN_STYLES = """
-<style>
-    .summary ul, .summary ol { margin: 8px 0; padding-left: 20px; }
-    .summary li { margin: 4px 0; color: #333; }
-    .summary p { margin: 8px 0; }
-    .summary strong, .summary b { font-weight: 600; }
-    .summary code { background: #f4f4f4; padding: 2px 6px; border-radius: 3px; font-size: 13px; }
-    .summary a { color: #1a73e8; }
-</style>
-"""
-
-
-def md_to_email_html(text: str) -> str:
-    if not text:
-        return "<p>No summary available.</p>"
-    html = mistune.html(text)
-    wrapped = f'{MARKDOWN_STYLES}<div class="summary">{html}</div>'
-    try:
-        return inline_styles(wrapped, strip_important=False)
-    except Exception:
-        return f"<div>{html}</div>"
+# One digest entry, filled in by render_email
+ITEM_TEMPLATE = """
+        <div style="margin-bottom: 28px; padding: 20px; background: #fafbfc; border-left: 4px solid #1a73e8; border-radius: 0 8px 8px 0;">
+            <h3 style="margin: 0 0 12px 0; font-size: 18px; color: #1a1a1a;">{title}</h3>
+            <div style="color: #333; font-size: 14px; line-height: 1.6;">{summary}</div>
+            <a href="{url}" style="display: inline-block; margin-top: 12px; padding: 8px 16px; background: #1a73e8; color: #fff; text-decoration: none; border-radius: 6px; font-size: 13px;">View Document →</a>
+        </div>
+        """
 
 
 def render_email(
@@ -102,17 +133,16 @@ def render_email(
     keywords: list[str] | None,
     date: str,
 ) -> str:
-    company_type = company_type or "your industry"
-    keywords_str = ", ".join(keywords) if keywords else "regulatory updates"
+    # company_type and keywords are free text from the signup form
+    company_type = escape(company_type or "your industry")
+    keywords_str = escape(", ".join(keywords) if keywords else "regulatory updates")
 
     items_html = "".join(
-        f"""
-        <div style="margin-bottom: 28px; padding: 20px; background: #fafbfc; border-left: 4px solid #1a73e8; border-radius: 0 8px 8px 0;">
-            <h3 style="margin: 0 0 12px 0; font-size: 18px; color: #1a1a1a;">{item['title']}</h3>
-            <div style="color: #333; font-size: 14px; line-height: 1.6;">{md_to_email_html(item['summary'])}</div>
-            <a href="{item['url']}" style="display: inline-block; margin-top: 12px; padding: 8px 16px; background: #1a73e8; color: #fff; text-decoration: none; border-radius: 6px; font-size: 13px;">View Document →</a>
-        </div>
-        """
+        ITEM_TEMPLATE.format(
+            title=escape(item["title"] or "Untitled"),
+            summary=md_to_email_html(item["summary"]),
+            url=escape(item["url"]),
+        )
         for item in items
     )
 
@@ -138,18 +168,18 @@ def render_email(
 
 
 def send_email(to: str, subject: str, html: str) -> bool:
-    resend.api_key = os.environ.get("RESEND_API_KEY", "")
     if not resend.api_key:
         logger.error("RESEND_API_KEY not set")
         return False
     try:
-        resend.Emails.send(
+        call_resend(
+            resend.Emails.send,
             {
                 "from": "pro@congresssignal.com",
                 "to": to,
                 "subject": subject,
                 "html": html,
-            }
+            },
         )
         return True
     except Exception as e:
@@ -172,16 +202,12 @@ def semantic_search(
 ) -> list[dict]:
     """Call the semantic-search edge function."""
     url = f"{SUPABASE_URL}/functions/v1/semantic-search"
-    headers = {
-        "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
-        "Content-Type": "application/json",
-    }
     payload = {
         "query": query,
         "matchCount": match_count,
         "matchThreshold": match_threshold,
     }
-    response = httpx.post(url, json=payload, headers=headers, timeout=30)
+    response = SEARCH_CLIENT.post(url, json=payload)
     response.raise_for_status()
     return response.json()
 
@@ -197,36 +223,48 @@ Focus on {keywords_str} and provide actionable takeaways for decision-making.
 Be concise but comprehensive."""
 
 
-def generate_summary(
-    firecrawl: Firecrawl, url: str, company_type: str | None, keywords: list[str] | None
-) -> str | None:
-    """Generate summary using Firecrawl."""
+def generate_summaries(
+    firecrawl: Firecrawl,
+    urls: list[str],
+    company_type: str | None,
+    keywords: list[str] | None,
+) -> dict[str, str]:
+    """Summarize documents with one Firecrawl batch scrape; returns url -> summary."""
     prompt = build_firecrawl_prompt(company_type, keywords)
     try:
-        doc = firecrawl.scrape(
-            url,
+        job = firecrawl.batch_scrape(
+            urls,
             formats=[
                 {
                     "type": "json",
-                    "schema": SummaryOutput.model_json_schema(),
+                    "schema": SUMMARY_SCHEMA,
                     "prompt": prompt,
                 }
             ],
+            max_concurrency=FIRECRAWL_CONCURRENCY,
         )
-        json_data = getattr(doc, "json", None)
-        if json_data:
-            summary = (
-                json_data.get("summary")
-                if isinstance(json_data, dict)
-                else getattr(json_data, "summary", None)
-            )
-            if summary:
-                return summary
-        logger.warning(f"Unexpected Firecrawl response: {doc}")
-        return None
     except Exception as e:
-        logger.error(f"Firecrawl error for {url}: {e}")
-        return None
+        logger.error(f"Firecrawl batch error for {len(urls)} URLs: {e}")
+        return {}
+
+    if job.status != "completed":
+        # Keep whatever finished; the rest stay without a summary
+        logger.warning(f"Firecrawl batch ended with status {job.status}")
+
+    summaries = {}
+    for doc in job.data or []:
+        url = getattr(doc.metadata, "source_url", None) if doc.metadata else None
+        json_data = getattr(doc, "json", None)
+        summary = (
+            json_data.get("summary")
+            if isinstance(json_data, dict)
+            else getattr(json_data, "summary", None)
+        )
+        if url and summary:
+            summaries[url] = summary
+        else:
+            logger.warning(f"Unexpected Firecrawl response: {doc}")
+    return summaries
 
 
 def process_pro_onboarding(sub: SubscriptionRecord):
@@ -260,19 +298,20 @@ def process_pro_onboarding(sub: SubscriptionRecord):
     logger.info(f"Found {len(results)} matching documents")
 
     # 2. Insert extractions_pro
-    document_ids = [r["document_id"] for r in results]
-    for doc_id in document_ids:
-        try:
-            supabase.table("extractions_pro").upsert(
-                {
-                    "subscription_pro_id": sub.id,
-                    "document_id": doc_id,
-                    "period_date": period_date,
-                },
-                on_conflict="subscription_pro_id,document_id,period_date",
-            ).execute()
-        except Exception as e:
-            logger.warning(f"Failed to upsert extraction for doc {doc_id}: {e}")
+    rows = [
+        {
+            "subscription_pro_id": sub.id,
+            "document_id": r["document_id"],
+            "period_date": period_date,
+        }
+        for r in results
+    ]
+    try:
+        supabase.table("extractions_pro").upsert(
+            rows, on_conflict="subscription_pro_id,document_id,period_date"
+        ).execute()
+    except Exception as e:
+        logger.warning(f"Failed to upsert extractions for {sub.email}: {e}")
 
     # 3. Fetch extractions needing summaries and generate them
     result = (
@@ -284,33 +323,48 @@ def process_pro_onboarding(sub: SubscriptionRecord):
         .execute()
     )
 
-    extractions = result.data or []
-    summaries = []
+    extractions = [
+        ext for ext in result.data or [] if ext.get("documents", {}).get("html_url")
+    ]
 
+    urls = [ext["documents"]["html_url"] for ext in extractions]
+    by_url = (
+        generate_summaries(firecrawl, urls, sub.company_type, sub.keywords)
+        if urls
+        else {}
+    )
+
+    summaries = []
+    rows = []
     for ext in extractions:
-        doc = ext.get("documents", {})
-        html_url = doc.get("html_url")
-        if not html_url:
+        doc = ext["documents"]
+        summary = by_url.get(doc["html_url"])
+        if not summary:
             continue
+        rows.append(
+            {
+                "id": ext["id"],
+                "subscription_pro_id": sub.id,
+                "document_id": ext["document_id"],
+                "period_date": period_date,
+                "summary": summary,
+            }
+        )
+        summaries.append(
+            {
+                "id": ext["id"],
+                "title": doc.get("title", "Untitled"),
+                "summary": summary,
+                "url": doc["html_url"],
+            }
+        )
 
-        summary = generate_summary(firecrawl, html_url, sub.company_type, sub.keywords)
-        if summary:
-            try:
-                supabase.table("extractions_pro").update({"summary": summary}).eq(
-                    "id", ext["id"]
-                ).execute()
-                summaries.append(
-                    {
-                        "id": ext["id"],
-                        "title": doc.get("title", "Untitled"),
-                        "summary": summary,
-                        "url": html_url,
-                    }
-                )
-            except Exception as e:
-                logger.error(
-                    f"Failed to update summary for extraction {ext['id']}: {e}"
-                )
+    if rows:
+        try:
+            supabase.table("extractions_pro").upsert(rows, on_conflict="id").execute()
+        except Exception as e:
+            logger.error(f"Failed to save summaries for {sub.email}: {e}")
+            summaries = []
 
     logger.info(f"Generated {len(summaries)} summaries for {sub.email}")
 
@@ -339,58 +393,65 @@ async def health():
     return {"status": "ok"}
 
 
-@app.post("/webhooks/pro-onboard")
-async def webhook_pro_onboard(request: Request, background_tasks: BackgroundTasks):
-    """
-    Handle subscriptions_pro INSERT webhook from Supabase.
-    Runs the full onboarding pipeline in the background.
+def log_onboarding_failure(future: Future) -> None:
+    if exc := future.exception():
+        logger.error(f"Pro onboarding failed: {exc!r}")
+
+
+async def verify_webhook_secret(request: Request) -> None:
+    """Reject calls without the shared secret, when one is configured.
+
+    Used as a route dependency so it runs before FastAPI validates the body;
+    unauthenticated callers get a 401, never the payload schema in a 422.
     """
-    # Optional: verify webhook secret
     if WEBHOOK_SECRET:
         auth_header = request.headers.get("x-webhook-secret", "")
         if auth_header != WEBHOOK_SECRET:
             raise HTTPException(status_code=401, detail="Invalid webhook secret")
 
-    try:
-        body = await request.json()
-        payload = WebhookPayload(**body)
-    except Exception as e:
-        logger.error(f"Invalid webhook payload: {e}")
-        raise HTTPException(status_code=400, detail="Invalid payload")
 
+@app.post("/webhooks/pro-onboard", dependencies=[Depends(verify_webhook_secret)])
+async def webhook_pro_onboard(payload: WebhookPayload):
+    """
+    Handle subscriptions_pro INSERT webhook from Supabase.
+    Runs the full onboarding pipeline in the background.
+
+    FastAPI validates the envelope against WebhookPayload; the record is only
+    checked as a subscription once the event is known to be an INSERT on
+    subscriptions_pro, so other events are still acknowledged.
+    """
     if payload.type != "INSERT" or payload.table != "subscriptions_pro":
         logger.warning(f"Ignoring webhook: type={payload.type}, table={payload.table}")
         return {"ok": True, "message": "Ignored"}
 
     try:
-        sub = SubscriptionRecord(**payload.record)
-    except Exception as e:
+        sub = SubscriptionRecord.model_validate(payload.record)
+    except ValidationError as e:
         logger.error(f"Invalid subscription record: {e}")
         raise HTTPException(status_code=400, detail="Invalid subscription record")
 
-    # Run in background so webhook returns quickly
-    background_tasks.add_task(process_pro_onboarding, sub)
+    # Queue it so the webhook returns quickly
+    ONBOARDING_POOL.submit(process_pro_onboarding, sub).add_done_callback(
+        log_onboarding_failure
+    )
 
     return {"ok": True, "message": f"Processing subscription {sub.id}"}
 
 
-@app.post("/webhooks/pro-digest")
-async def webhook_pro_digest(request: Request, background_tasks: BackgroundTasks):
+@app.post("/webhooks/pro-digest", dependencies=[Depends(verify_webhook_secret)])
+async def webhook_pro_digest(background_tasks: BackgroundTasks):
     """
     Trigger daily pro digest processing.
     Can be called by a cron job or manual trigger.
     """
-    if WEBHOOK_SECRET:
-        auth_header = request.headers.get("x-webhook-secret", "")
-        if auth_header != WEBHOOK_SECRET:
-            raise HTTPException(status_code=401, detail="Invalid webhook secret")
-
     # Import and run the digest scripts
     from scripts.sync_pro_digests import sync_pro_digests
     from scripts.generate_pro_summaries import generate_pro_summaries
     from scripts.send_pro_digest import send_pro_digests
 
-    async def run_digest_pipeline():
+    # A plain def, so Starlette runs it in its threadpool; the stages all block
+    # on network I/O and would otherwise stall the event loop for the whole run
+    def run_digest_pipeline():
         try:
             logger.info("Starting pro digest pipeline")
 
@@ -7,6 +7,40 @@ const session = new Supabase.ai.Session("gte-small");
 Deno.serve(async (req)=>{
   try {
     const payload = await req.json();
+    // Batch mode (backfill script): { records: [{ id, summary }, ...] }
+    if (Array.isArray(payload.records)) {
+      const rows = [];
+      for (const rec of payload.records){
+        if (!rec.summary) continue;
+        const embedding = await session.run(rec.summary, {
+          mean_pool: true,
+          normalize: true
+        });
+        rows.push({
+          id: rec.id,
+          embedding: JSON.stringify(embedding)
+        });
+      }
+      // One UPDATE for the whole batch instead of one per record
+      if (rows.length > 0) {
+        const supabase = createClient(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY);
+        const { error } = await supabase.rpc("bulk_update_embeddings", {
+          payload: rows
+        });
+        if (error) {
+          throw new Error(`Supabase update error: ${error.message}`);
+        }
+      }
+      return new Response(JSON.stringify({
+        message: "Embeddings generated successfully",
+        ids: rows.map((row)=>row.id)
+      }), {
+        status: 200,
+        headers: {
+          "Content-Type": "application/json"
+        }
+      });
+    }
     const { record, old_record } = payload;
     // Skip if no summary
     if (!record.summary) {
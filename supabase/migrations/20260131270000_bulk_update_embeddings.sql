@@ -0,0 +1,18 @@
+-- Write a batch of embeddings in a single UPDATE (generate-embedding batch mode)
+-- payload: [{"id": 1, "embedding": "[0.1, ...]"}, ...]
+CREATE OR REPLACE FUNCTION bulk_update_embeddings(payload jsonb)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    updated int;
+BEGIN
+    UPDATE extractions e
+    SET summary_embedding = p.embedding::vector(384)
+    FROM jsonb_to_recordset(payload) AS p(id int, embedding text)
+    WHERE e.id = p.id;
+
+    GET DIAGNOSTICS updated = ROW_COUNT;
+    RETURN updated;
+END;
+$$;
@@ -0,0 +1,24 @@
+-- Documents with an HTML page but no extraction yet (scripts/extract.py)
+-- NOT EXISTS lets Postgres stop at the first matching extraction per document
+CREATE OR REPLACE FUNCTION unprocessed_documents(
+    p_limit int DEFAULT NULL,
+    p_date date DEFAULT NULL
+)
+RETURNS TABLE (
+    id int,
+    html_url text,
+    publish_date date
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT d.id, d.html_url, d.publish_date
+    FROM documents d
+    WHERE d.html_url IS NOT NULL
+      AND (p_date IS NULL OR d.publish_date = p_date)
+      AND NOT EXISTS (
+          SELECT 1 FROM extractions e WHERE e.document_id = d.id
+      )
+    ORDER BY d.id
+    LIMIT p_limit;
+$$;
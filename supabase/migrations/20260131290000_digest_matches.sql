@@ -0,0 +1,38 @@
+-- Matching extractions per subscription for the daily digest (scripts/send_digest.py)
+-- Same rules as the old Python filters:
+--   relevance at or above the subscription threshold (enum order: high < medium < low)
+--   any sector overlap; no sectors matches everything
+--   any keyword as a case-insensitive substring of title, summary or companies;
+--   no keywords matches everything
+CREATE OR REPLACE FUNCTION digest_matches(p_date date)
+RETURNS TABLE (
+    subscription_id int,
+    extraction_ids int[]
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT s.id, array_agg(e.id ORDER BY e.id)
+    FROM extractions e
+    JOIN documents d ON d.id = e.document_id
+    JOIN subscriptions s
+      ON s.is_verified
+     AND s.unsubscribed_at IS NULL
+     AND e.relevance <= COALESCE(s.relevance_threshold, 'medium')
+     AND (COALESCE(cardinality(s.sectors), 0) = 0 OR e.sectors && s.sectors)
+     AND (
+         COALESCE(cardinality(s.keywords), 0) = 0
+         OR EXISTS (
+             SELECT 1
+             FROM unnest(s.keywords) AS kw
+             WHERE strpos(
+                 lower(concat_ws(
+                     ' ', e.title, e.summary, array_to_string(e.companies_mentioned, ' ')
+                 )),
+                 lower(kw)
+             ) > 0
+         )
+     )
+    WHERE d.publish_date = p_date
+    GROUP BY s.id;
+$$;
@@ -0,0 +1,46 @@
+-- Build each extraction's lowercased search text and each subscription's
+-- lowercased keywords once, instead of once per (subscription, extraction) pair
+CREATE OR REPLACE FUNCTION digest_matches(p_date date)
+RETURNS TABLE (
+    subscription_id int,
+    extraction_ids int[]
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH ext AS MATERIALIZED (
+        SELECT
+            e.id,
+            e.sectors,
+            e.relevance,
+            lower(concat_ws(
+                ' ', e.title, e.summary, array_to_string(e.companies_mentioned, ' ')
+            )) AS search_text
+        FROM extractions e
+        JOIN documents d ON d.id = e.document_id
+        WHERE d.publish_date = p_date
+    ),
+    sub AS MATERIALIZED (
+        SELECT
+            s.id,
+            s.sectors,
+            COALESCE(s.relevance_threshold, 'medium') AS threshold,
+            ARRAY(SELECT lower(kw) FROM unnest(s.keywords) AS kw) AS keywords
+        FROM subscriptions s
+        WHERE s.is_verified AND s.unsubscribed_at IS NULL
+    )
+    SELECT sub.id, array_agg(ext.id ORDER BY ext.id)
+    FROM ext
+    JOIN sub
+      ON ext.relevance <= sub.threshold
+     AND (COALESCE(cardinality(sub.sectors), 0) = 0 OR ext.sectors && sub.sectors)
+     AND (
+         cardinality(sub.keywords) = 0
+         OR EXISTS (
+             SELECT 1
+             FROM unnest(sub.keywords) AS kw
+             WHERE strpos(ext.search_text, kw) > 0
+         )
+     )
+    GROUP BY sub.id;
+$$;
@@ -0,0 +1,56 @@
+-- Pair subscriptions with extractions through a sector -> ids posting list
+-- (hash join on the unnested sector arrays) so only pairs sharing a sector are
+-- checked; subscriptions without sectors still see every extraction
+CREATE OR REPLACE FUNCTION digest_matches(p_date date)
+RETURNS TABLE (
+    subscription_id int,
+    extraction_ids int[]
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH ext AS MATERIALIZED (
+        SELECT
+            e.id,
+            e.sectors,
+            e.relevance,
+            lower(concat_ws(
+                ' ', e.title, e.summary, array_to_string(e.companies_mentioned, ' ')
+            )) AS search_text
+        FROM extractions e
+        JOIN documents d ON d.id = e.document_id
+        WHERE d.publish_date = p_date
+    ),
+    sub AS MATERIALIZED (
+        SELECT
+            s.id,
+            s.sectors,
+            COALESCE(s.relevance_threshold, 'medium') AS threshold,
+            ARRAY(SELECT lower(kw) FROM unnest(s.keywords) AS kw) AS keywords
+        FROM subscriptions s
+        WHERE s.is_verified AND s.unsubscribed_at IS NULL
+    ),
+    candidates AS (
+        SELECT DISTINCT ss.id AS sub_id, es.id AS ext_id
+        FROM (SELECT id, unnest(sectors) AS sector FROM sub) ss
+        JOIN (SELECT id, unnest(sectors) AS sector FROM ext) es USING (sector)
+        UNION ALL
+        SELECT sub.id, ext.id
+        FROM sub CROSS JOIN ext
+        WHERE COALESCE(cardinality(sub.sectors), 0) = 0
+    )
+    SELECT sub.id, array_agg(ext.id ORDER BY ext.id)
+    FROM candidates c
+    JOIN sub ON sub.id = c.sub_id
+    JOIN ext ON ext.id = c.ext_id
+    WHERE ext.relevance <= sub.threshold
+      AND (
+          cardinality(sub.keywords) = 0
+          OR EXISTS (
+              SELECT 1
+              FROM unnest(sub.keywords) AS kw
+              WHERE strpos(ext.search_text, kw) > 0
+          )
+      )
+    GROUP BY sub.id;
+$$;
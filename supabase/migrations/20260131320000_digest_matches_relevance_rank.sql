@@ -0,0 +1,59 @@
+-- Turn relevance into an integer rank once per extraction and once per
+-- subscription (1 = high), and apply the threshold while building candidate
+-- pairs so the DISTINCT and keyword checks only see pairs that can match
+CREATE OR REPLACE FUNCTION digest_matches(p_date date)
+RETURNS TABLE (
+    subscription_id int,
+    extraction_ids int[]
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH ext AS MATERIALIZED (
+        SELECT
+            e.id,
+            e.sectors,
+            array_position(enum_range(NULL::relevance), e.relevance) AS rel_rank,
+            lower(concat_ws(
+                ' ', e.title, e.summary, array_to_string(e.companies_mentioned, ' ')
+            )) AS search_text
+        FROM extractions e
+        JOIN documents d ON d.id = e.document_id
+        WHERE d.publish_date = p_date
+          AND e.relevance IS NOT NULL
+    ),
+    sub AS MATERIALIZED (
+        SELECT
+            s.id,
+            s.sectors,
+            array_position(
+                enum_range(NULL::relevance),
+                COALESCE(s.relevance_threshold, 'medium')
+            ) AS max_rank,
+            ARRAY(SELECT lower(kw) FROM unnest(s.keywords) AS kw) AS keywords
+        FROM subscriptions s
+        WHERE s.is_verified AND s.unsubscribed_at IS NULL
+    ),
+    candidates AS (
+        SELECT DISTINCT ss.id AS sub_id, es.id AS ext_id
+        FROM (SELECT id, max_rank, unnest(sectors) AS sector FROM sub) ss
+        JOIN (SELECT id, rel_rank, unnest(sectors) AS sector FROM ext) es
+          ON es.sector = ss.sector AND es.rel_rank <= ss.max_rank
+        UNION ALL
+        SELECT sub.id, ext.id
+        FROM sub
+        JOIN ext ON ext.rel_rank <= sub.max_rank
+        WHERE COALESCE(cardinality(sub.sectors), 0) = 0
+    )
+    SELECT sub.id, array_agg(ext.id ORDER BY ext.id)
+    FROM candidates c
+    JOIN sub ON sub.id = c.sub_id
+    JOIN ext ON ext.id = c.ext_id
+    WHERE cardinality(sub.keywords) = 0
+       OR EXISTS (
+           SELECT 1
+           FROM unnest(sub.keywords) AS kw
+           WHERE strpos(ext.search_text, kw) > 0
+       )
+    GROUP BY sub.id;
+$$;
@@ -0,0 +1,48 @@
+-- Upsert a batch of documents in a single statement (sync --bulk backfills).
+-- Rows whose crawled_at isn't newer than the stored one are left alone, so
+-- re-running a backfill doesn't rewrite (and bloat) rows that are current.
+-- payload: [{"package_id": "...", "granule_id": "...", ..., "crawled_at": "..."}, ...]
+CREATE OR REPLACE FUNCTION bulk_upsert_documents(payload jsonb)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    written int;
+BEGIN
+    INSERT INTO documents (
+        package_id, granule_id, title, doc_class, publish_date, metadata,
+        pdf_url, html_url, details_url, summary, crawled_at
+    )
+    SELECT
+        p.package_id, p.granule_id, p.title, p.doc_class, p.publish_date,
+        p.metadata, p.pdf_url, p.html_url, p.details_url, p.summary,
+        p.crawled_at
+    FROM jsonb_to_recordset(payload) AS p(
+        package_id text,
+        granule_id text,
+        title text,
+        doc_class text,
+        publish_date date,
+        metadata text,
+        pdf_url text,
+        html_url text,
+        details_url text,
+        summary text,
+        crawled_at timestamptz
+    )
+    ON CONFLICT (package_id, granule_id) DO UPDATE SET
+        title = excluded.title,
+        doc_class = excluded.doc_class,
+        publish_date = excluded.publish_date,
+        metadata = excluded.metadata,
+        pdf_url = excluded.pdf_url,
+        html_url = excluded.html_url,
+        details_url = excluded.details_url,
+        summary = excluded.summary,
+        crawled_at = excluded.crawled_at
+    WHERE excluded.crawled_at > documents.crawled_at;
+
+    GET DIAGNOSTICS written = ROW_COUNT;
+    RETURN written;
+END;
+$$;
@@ -5,21 +5,35 @@ Usage:
     uv run python -m supabase.sync --date 2026-01-30
     uv run python -m supabase.sync --yesterday
     uv run python -m supabase.sync --sync-only
+    uv run python -m supabase.sync --sync-only --concurrency 16 --batch-size 1000
+    uv run python -m supabase.sync --sync-only --bulk
+    uv run python -m supabase.sync --sync-only --full
 """
 
 import os
 import sys
+import random
 import sqlite3
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta
+from functools import lru_cache, partial
+from operator import attrgetter, itemgetter
 import logging
 
-from supabase import create_client, Client
+import httpx
+import orjson
+from supabase import create_client, Client, ClientOptions, PostgrestAPIError
 from dotenv import load_dotenv
 
 # Add parent dir to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from crawler.govinfo import crawl_day, init_db, DEFAULT_DB_PATH
+from common.rate_limit import RateLimiter
+from crawler.govinfo import crawl_chunks, init_db, DEFAULT_DB_PATH
 
 load_dotenv()
 
@@ -28,6 +42,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+BATCH_SIZE = 500  # documents per upsert request
+MAX_CONCURRENCY = 8  # upsert requests in flight at once
+MAX_ATTEMPTS = 5  # tries per batch before the sync gives up
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# PostgREST couldn't connect to Postgres or its schema cache isn't loaded yet
+RETRY_CODES = {"PGRST000", "PGRST001", "PGRST002", "PGRST003"}
+MAX_BACKOFF = 30.0  # seconds
+MAX_REQUESTS_PER_SECOND = 20.0  # upserts started per second, across threads
+PROGRESS_EVERY = 10  # batches between progress logs
+ALL_DATES = "*"  # sync_state key for syncs that aren't limited to one date
+
+# Columns uploaded to the documents table, in payload order
+DOCUMENT_FIELDS = (
+    "package_id",
+    "granule_id",
+    "title",
+    "doc_class",
+    "publish_date",
+    "metadata",
+    "pdf_url",
+    "html_url",
+    "details_url",
+    "summary",
+    "crawled_at",
+)
+TEXT_FIELDS = ("title", "metadata", "summary")  # free text that may hold NULs
+# A row is a tuple of DOCUMENT_FIELDS values, in that order
+Row = tuple
+doc_fields = itemgetter(*DOCUMENT_FIELDS)
+# crawler Documents don't carry crawled_at; it's stamped per crawl
+crawled_doc_fields = attrgetter(*DOCUMENT_FIELDS[:-1])
+
 
 def sanitize_text(s: str | None) -> str | None:
     """Remove null bytes that Postgres can't handle."""
@@ -36,118 +82,343 @@ def sanitize_text(s: str | None) -> str | None:
     return s.replace("\x00", "")
 
 
-def get_supabase_client() -> Client:
-    """Get Supabase client from environment variables."""
+@dataclass(frozen=True, slots=True)
+class Config:
+    supabase_url: str
+    supabase_key: str = field(repr=False)
+
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Read the sync's settings from the environment, once per process."""
     url = os.environ.get("SUPABASE_URL")
     key = os.environ.get("SUPABASE_KEY") or os.environ.get("SUPABASE_SERVICE_ROLE_API_KEY")
 
     if not url or not key:
         raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables required")
+    return Config(supabase_url=url, supabase_key=key)
 
-    return create_client(url, key)
+
+@lru_cache(maxsize=1)
+def get_supabase_client() -> Client:
+    """Get Supabase client from the environment config.
+
+    Cached, so every sync in the process shares one client and its pool of
+    keep-alive connections.
+    """
+    config = get_config()
+
+    # Over HTTP/2 the parallel upserts share one multiplexed connection (httpx
+    # logs each response as "HTTP/2 201 Created"); the pool limits keep enough
+    # idle connections for MAX_CONCURRENCY if the server falls back to
+    # HTTP/1.1. http2, redirects and timeout match postgrest's own defaults
+    http_client = httpx.Client(
+        http2=True,
+        follow_redirects=True,
+        timeout=120,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+    )
+    return create_client(
+        config.supabase_url,
+        config.supabase_key,
+        options=ClientOptions(httpx_client=http_client),
+    )
+
+
+# Supabase rate-limits per project, so this is shared by every upload thread
+SUPABASE_LIMITER = RateLimiter(rate=MAX_REQUESTS_PER_SECOND)
+
+
+@lru_cache(maxsize=2)
+def documents_endpoint(
+    supabase: Client, bulk: bool = False
+) -> tuple[httpx.URL, dict[str, str]]:
+    """URL and headers of a documents upsert, built once per client.
+
+    Equivalent to what ``table("documents").upsert(..., on_conflict=...)``
+    sends, but the columns come from DOCUMENT_FIELDS instead of a scan of
+    every record's keys, and no request builder is made per batch. The
+    upserted rows aren't needed back, so PostgREST is told to reply with an
+    empty body. With ``bulk`` it's the bulk_upsert_documents RPC instead.
+    """
+    postgrest = supabase.postgrest
+    # The body is encoded by hand (see post_documents), so httpx won't set this
+    headers = {**postgrest.headers, "Content-Type": "application/json"}
+    if bulk:
+        return httpx.URL(str(postgrest.base_url / "rpc/bulk_upsert_documents")), headers
+    url = httpx.URL(
+        str(postgrest.base_url / "documents"),
+        params={
+            "on_conflict": "package_id,granule_id",
+            "columns": ",".join(f'"{name}"' for name in DOCUMENT_FIELDS),
+        },
+    )
+    headers["Prefer"] = "return=minimal,resolution=merge-duplicates"
+    return url, headers
+
+
+def post_documents(supabase: Client, records: list[dict], bulk: bool = False) -> None:
+    """Upsert records straight through the PostgREST session.
+
+    The body is encoded with orjson, which is several times faster than the
+    stdlib encoder httpx would use for ``json=`` on these text-heavy rows.
+    """
+    url, headers = documents_endpoint(supabase, bulk)
+    body = orjson.dumps({"payload": records} if bulk else records)
+    resp = supabase.postgrest.session.post(url, content=body, headers=headers)
+    if resp.is_success:
+        return
+    try:
+        error = resp.json()
+    except ValueError:
+        error = None
+    # Same shape postgrest gives errors without a PostgREST body
+    if not isinstance(error, dict) or "code" not in error:
+        error = {"message": resp.text, "code": resp.status_code}
+    raise PostgrestAPIError(error)
+
+
+def is_transient(exc: Exception) -> bool:
+    """Whether a failed upsert is worth retrying."""
+    if isinstance(exc, httpx.TransportError):
+        return True  # timeouts and dropped connections
+    # Responses without a PostgREST error body (e.g. gateway 429/5xx) carry
+    # the HTTP status as their code
+    return exc.code in RETRY_STATUSES or exc.code in RETRY_CODES
+
+
+def dedupe_rows(batch: list[Row]) -> list[Row]:
+    """Keep one row per (package_id, granule_id), the latest crawled.
+
+    PostgREST rejects a whole batch that would upsert the same row twice.
+    """
+    latest: dict[tuple, Row] = {}
+    for row in batch:
+        key = row[:2]
+        kept = latest.get(key)
+        if kept is None or row[-1] > kept[-1]:
+            latest[key] = row
+    return list(latest.values())
+
+
+def upsert_batch(supabase: Client, batch: list[Row], bulk: bool = False) -> int:
+    """Upsert one batch of document rows; returns how many were sent.
+
+    With ``bulk`` the batch goes through the bulk_upsert_documents RPC, which
+    skips rows whose crawled_at isn't newer than the stored copy instead of
+    rewriting every row. Requests are paced by SUPABASE_LIMITER. Rate limits
+    and transient server errors are retried with jittered backoff; a 429
+    pauses the limiter so every upload thread backs off, not just this one.
+    Anything else raises at once. Duplicate keys in the batch are dropped
+    first (see dedupe_rows).
+    """
+    batch = dedupe_rows(batch)
+    records = [dict(zip(DOCUMENT_FIELDS, row)) for row in batch]
+    for record in records:
+        for name in TEXT_FIELDS:
+            record[name] = sanitize_text(record[name])
+
+    # With bulk the RPC still goes over PostgREST, which runs it on its own
+    # pooled Postgres connections, so concurrent batches can't exhaust
+    # max_connections
+    send = partial(post_documents, supabase, records, bulk)
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        SUPABASE_LIMITER.wait()
+        try:
+            send()
+            return len(batch)
+        except (PostgrestAPIError, httpx.TransportError) as e:
+            if not is_transient(e):
+                raise
+            if attempt == MAX_ATTEMPTS:
+                logger.error(f"Upsert failed after {attempt} attempts: {e}")
+                raise
+            delay = min(2**attempt + random.uniform(0, 1), MAX_BACKOFF)
+            logger.warning(
+                f"Upsert failed ({e}), retrying in {delay:.1f}s "
+                f"(attempt {attempt}/{MAX_ATTEMPTS})"
+            )
+            if getattr(e, "code", None) == 429:
+                SUPABASE_LIMITER.pause(delay)  # the next wait() sleeps it off
+            else:
+                time.sleep(delay)
+
+
+def upsert_batches(
+    supabase: Client,
+    batches: Iterable[list[Row]],
+    expected: int | None = None,
+    concurrency: int = MAX_CONCURRENCY,
+    bulk: bool = False,
+) -> int:
+    """Upsert batches on a thread pool, ``concurrency`` requests at a time.
+
+    A new batch is only pulled from ``batches`` when a slot frees up, so a
+    lazy source such as a database cursor or a running crawl is read in step
+    with the upload rather than all at once, and producing the next batch
+    overlaps with the requests still in flight. The first batch that fails
+    raises. ``expected`` is only used for progress logs, written every
+    PROGRESS_EVERY batches and at the end.
+    """
+    total = 0
+    done = 0
+    in_flight: deque[Future] = deque()
+
+    def log_progress():
+        if expected is None:
+            logger.info("Synced %d documents", total)
+        else:
+            logger.info("Synced %d/%d documents", total, expected)
+
+    def wait_oldest():
+        nonlocal total, done
+        total += in_flight.popleft().result()
+        done += 1
+        if done % PROGRESS_EVERY == 0:
+            log_progress()
+        else:
+            logger.debug("Synced batch %d (%d documents)", done, total)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for batch in batches:
+            if len(in_flight) >= concurrency:
+                wait_oldest()
+            in_flight.append(pool.submit(upsert_batch, supabase, batch, bulk))
+        while in_flight:
+            wait_oldest()
+
+    if done % PROGRESS_EVERY:
+        log_progress()
+    return total
 
 
 def sync_to_supabase(
     supabase: Client,
     docs: list[dict],
-    batch_size: int = 100,
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = MAX_CONCURRENCY,
 ) -> int:
-    """Upload documents to Supabase using upsert."""
-    total = 0
+    """Upload documents to Supabase using upsert.
+
+    Batches are sent through upsert_batches, so the upload isn't bound by one
+    PostgREST round-trip per batch.
+
+    Larger batches spread each request's round-trip and PostgREST parse
+    overhead over more rows, with diminishing returns; very large bodies risk
+    request and statement timeouts. The two knobs multiply: roughly
+    ``batch_size * concurrency`` rows are being written at any moment.
+    """
+    batches = (
+        [doc_fields(doc) for doc in docs[i : i + batch_size]]
+        for i in range(0, len(docs), batch_size)
+    )
+    return upsert_batches(supabase, batches, len(docs), concurrency)
 
-    for i in range(0, len(docs), batch_size):
-        batch = docs[i : i + batch_size]
-
-        records = [
-            {
-                "package_id": doc["package_id"],
-                "granule_id": doc["granule_id"],
-                "title": sanitize_text(doc["title"]),
-                "doc_class": doc["doc_class"],
-                "publish_date": doc["publish_date"],
-                "metadata": sanitize_text(doc["metadata"]),
-                "pdf_url": doc["pdf_url"],
-                "html_url": doc["html_url"],
-                "details_url": doc["details_url"],
-                "summary": sanitize_text(doc["summary"]),
-                "crawled_at": doc["crawled_at"],
-            }
-            for doc in batch
-        ]
-
-        supabase.table("documents").upsert(
-            records, on_conflict="package_id,granule_id"
-        ).execute()
-
-        total += len(batch)
-        logger.info(f"Synced {total}/{len(docs)} documents")
 
-    return total
+def iter_batches(cur: sqlite3.Cursor, size: int) -> Iterator[list[Row]]:
+    """Yield a cursor's rows in lists of at most ``size``."""
+    while rows := cur.fetchmany(size):
+        yield rows
 
 
 def sync_from_sqlite(
     supabase: Client,
     db_path: Path,
     date: str | None = None,
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = MAX_CONCURRENCY,
+    bulk: bool = False,
+    full: bool = False,
 ) -> int:
-    """Sync documents from SQLite to Supabase."""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-
-    if date:
-        rows = conn.execute(
-            "SELECT * FROM documents WHERE publish_date = ?", (date,)
-        ).fetchall()
-    else:
-        rows = conn.execute("SELECT * FROM documents").fetchall()
-
-    docs = [dict(row) for row in rows]
-    conn.close()
-
-    if not docs:
-        logger.info("No documents to sync")
-        return 0
-
-    logger.info(f"Syncing {len(docs)} documents to Supabase...")
-    return sync_to_supabase(supabase, docs)
+    """Sync documents from SQLite to Supabase.
+
+    Only rows crawled since the last successful sync of the same date (or of
+    the whole table) are sent, tracked by a crawled_at high-water mark in
+    sync_state; ``full`` ignores it and sends everything again. Don't run
+    this alongside a crawl of the same dates, whose rows could land behind
+    the mark.
+
+    Rows are streamed from the cursor one batch at a time, so memory stays
+    at a few batches however large the table is. Only the uploaded columns
+    are selected, in DOCUMENT_FIELDS order, so the plain tuples SQLite
+    returns go straight into the payload. Use ``bulk`` for large backfills
+    (see upsert_batch).
+    """
+    conn = init_db(db_path)
+
+    try:
+        key = date or ALL_DATES
+        row = conn.execute(
+            "SELECT last_synced_at FROM sync_state WHERE date = ?", (key,)
+        ).fetchone()
+        since = "" if full or row is None else row[0]
+
+        query = f"SELECT {', '.join(DOCUMENT_FIELDS)} FROM documents"
+        query += " WHERE crawled_at > ?"
+        params: tuple = (since,)
+        if date:
+            query += " AND publish_date = ?"
+            params += (date,)
+
+        count, newest = conn.execute(
+            f"SELECT COUNT(*), MAX(crawled_at) FROM ({query})", params
+        ).fetchone()
+        if not count:
+            logger.info("No new documents to sync")
+            return 0
+
+        logger.info(f"Syncing {count} documents to Supabase...")
+        cur = conn.execute(query, params)
+        total = upsert_batches(
+            supabase, iter_batches(cur, batch_size), count, concurrency, bulk
+        )
+
+        # Only reached once every batch is in, so a failed sync is redone
+        conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (key, newest))
+        conn.commit()
+        return total
+    finally:
+        conn.close()
+
+
+def crawled_batches(
+    date: str, db_path: Path, batch_size: int = BATCH_SIZE
+) -> Iterator[list[Row]]:
+    """Crawl a date to local SQLite, yielding upload batches as chunks land.
+
+    Supabase gets the same crawled_at as the local rows, so the sync_state
+    mark and bulk_upsert_documents compare like with like.
+    """
+    crawled_at = datetime.now().isoformat()
+    for docs in crawl_chunks(date, date, db_path, crawled_at=crawled_at):
+        rows = [(*crawled_doc_fields(doc), crawled_at) for doc in docs]
+        for i in range(0, len(rows), batch_size):
+            yield rows[i : i + batch_size]
 
 
 def crawl_and_sync(
     supabase: Client,
     date: str,
     db_path: Path | None = None,
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = MAX_CONCURRENCY,
 ) -> int:
-    """Crawl a date and sync directly to Supabase."""
+    """Crawl a date and sync directly to Supabase.
+
+    Crawling and uploading run as a pipeline: while earlier batches are being
+    upserted on the pool, the next chunk is crawled, so wall time is roughly
+    the slower of the two rather than their sum.
+    """
     if db_path is None:
         db_path = DEFAULT_DB_PATH
 
-    # Crawl to local SQLite first
-    docs = crawl_day(date, db_path)
-
-    if not docs:
+    total = upsert_batches(
+        supabase, crawled_batches(date, db_path, batch_size), concurrency=concurrency
+    )
+    if not total:
         logger.info("No documents crawled")
-        return 0
-
-    # Convert to dicts for Supabase
-    crawled_at = datetime.now().isoformat()
-    doc_dicts = [
-        {
-            "package_id": doc.package_id,
-            "granule_id": doc.granule_id,
-            "title": doc.title,
-            "doc_class": doc.doc_class,
-            "publish_date": doc.publish_date,
-            "metadata": doc.metadata,
-            "pdf_url": doc.pdf_url,
-            "html_url": doc.html_url,
-            "details_url": doc.details_url,
-            "summary": doc.summary,
-            "crawled_at": crawled_at,
-        }
-        for doc in docs
-    ]
-
-    return sync_to_supabase(supabase, doc_dicts)
+    return total
 
 
 def main():
@@ -161,26 +432,69 @@ def main():
     parser.add_argument(
         "--sync-only", action="store_true", help="Only sync existing SQLite data"
     )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="With --sync-only, upsert through bulk_upsert_documents and skip "
+        "rows that aren't newer",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="With --sync-only, resend every row instead of only new ones",
+    )
     parser.add_argument(
         "--db",
         type=Path,
         default=DEFAULT_DB_PATH,
         help="SQLite database path",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help=f"Documents per upsert request (default: {BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=MAX_CONCURRENCY,
+        help=f"Upsert requests to run in parallel (default: {MAX_CONCURRENCY})",
+    )
 
     args = parser.parse_args()
 
     supabase = get_supabase_client()
 
     if args.sync_only:
-        count = sync_from_sqlite(supabase, args.db, args.date)
+        count = sync_from_sqlite(
+            supabase,
+            args.db,
+            args.date,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            bulk=args.bulk,
+            full=args.full,
+        )
         logger.info(f"Synced {count} documents from SQLite to Supabase")
     elif args.yesterday:
         yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-        count = crawl_and_sync(supabase, yesterday, args.db)
+        count = crawl_and_sync(
+            supabase,
+            yesterday,
+            args.db,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+        )
         logger.info(f"Crawled and synced {count} documents for {yesterday}")
     elif args.date:
-        count = crawl_and_sync(supabase, args.date, args.db)
+        count = crawl_and_sync(
+            supabase,
+            args.date,
+            args.db,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+        )
         logger.info(f"Crawled and synced {count} documents for {args.date}")
     else:
         parser.print_help()